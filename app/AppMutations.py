@@ -3,6 +3,10 @@ from flask_graphql_auth import create_access_token, create_refresh_token, mutati
 from graphene import ObjectType, List, Mutation, String, Field, Boolean, Int
 from werkzeug.security import generate_password_hash, check_password_hash
 from .ProtectedFields import ProtectedBool, BooleanField, ProtectedString, StringField
+from app.Loaders import get_or_none, get_current_user, get_reference, forget
+from app.Checkpoints import move_checkpoint, delete_checkpoint, append_checkpoints
+from app.Badges import add_progress, add_progress_batch
+from app.Members import is_member, add_member, remove_member
 from app.Fields import User, AppFeedback, Favourites, Tour, Question, Answer, TourFeedback, MCQuestion, \
     MCAnswer, Checkpoint, PictureCheckpoint, ObjectCheckpoint, CheckpointUnion
 from models.User import User as UserModel
@@ -15,7 +19,6 @@ from models.MuseumObject import MuseumObject as MuseumObjectModel
 from models.AppFeedback import AppFeedback as AppFeedbackModel
 from models.TourFeedback import TourFeedback as TourFeedbackModel
 from models.Picture import Picture as PictureModel
-from models.Badge import Badge as BadgeModel
 from models.MultipleChoiceQuestion import MultipleChoiceQuestion as MCQuestionModel
 from models.MultipleChoiceAnswer import MultipleChoiceAnswer as MCAnswerModel
 from models.ProfilePicture import ProfilePicture as ProfilePictureModel
@@ -57,7 +60,7 @@ class CreateUser(Mutation):
     def mutate(self, info, username, password):
         # ensure there is no user with this name
         # making this check here prevents a mongoengine error but uniqueness of the name is also enforced in the model
-        if not UserModel.objects(username=username):
+        if get_or_none(UserModel, username=username) is None:
             # password is hashed before storing
             user = UserModel(username=username, password=generate_password_hash(password))
             user.save()
@@ -87,32 +90,42 @@ class AddBadgeProgress(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, badge_id, progress):
-        # get the user object to reference
-        username = get_jwt_identity()
-        user = UserModel.objects.get(username=username)
-        # assert the badge exists
-        if not BadgeModel.objects(id=badge_id):
+        # progress is capped at the cost of the badge, which is awarded once the cost is reached
+        user = add_progress(get_jwt_identity(), badge_id, progress)
+        if user is None:
             return AddBadgeProgress(user=None, ok=BooleanField(boolean=False))
-        else:
-            # check the user's current progress towards the badge
-            badge = BadgeModel.objects.get(id=badge_id)
-            user_progress = user.badge_progress
-            current = user_progress[badge_id]
-            # if the user progressed past the cost of the badge set the current progress to the badge cost
-            if current + progress >= badge.cost:
-                user_progress[badge_id] = badge.cost
-                # award the user the badge if they do not already own it
-                if badge not in user.badges:
-                    badges = user.badges
-                    badges.append(badge)
-                    user.update(set__badges=badges)
-                    user.save()
-                    user.reload()
-            else:
-                user_progress[badge_id] = current + progress
-            user.update(set__badge_progress=user_progress)
-            user.save()
-            return AddBadgeProgress(user=user, ok=BooleanField(boolean=True))
+        return AddBadgeProgress(user=user, ok=BooleanField(boolean=True))
+
+
+class AddBadgeProgressBatch(Mutation):
+    """Add progress towards several badges at once, e.g. events the app collected while offline.
+            Parameters: token, String, valid jwt access token of a user
+                        badge_ids, List of String, the internal ids of the badges
+                        progress, List of Int, progress towards the badge at the same position in badge_ids
+            progress towards the same badge is added up. badges are awarded as in AddBadgeProgress
+            if successful returns the updated user object and ok=True
+            if unsuccessful because the token was invalid returns empty value for ok
+            if unsuccessful because of an invalid badge id or lists of different length returns Null and False.
+                no progress is added in that case
+        """
+
+    class Arguments:
+        token = String()
+        badge_ids = List(of_type=String, required=True)
+        progress = List(of_type=Int, required=True)
+
+    ok = Field(ProtectedBool)
+    user = Field(lambda: User)
+
+    @classmethod
+    @mutation_jwt_required
+    def mutate(cls, _, info, badge_ids, progress):
+        if len(badge_ids) != len(progress):
+            return AddBadgeProgressBatch(user=None, ok=BooleanField(boolean=False))
+        if not add_progress_batch(get_jwt_identity(), zip(badge_ids, progress)):
+            return AddBadgeProgressBatch(user=None, ok=BooleanField(boolean=False))
+        user = get_current_user()
+        return AddBadgeProgressBatch(user=user, ok=BooleanField(boolean=True))
 
 
 class PromoteUser(Mutation):
@@ -134,17 +147,16 @@ class PromoteUser(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, code):
-        username = get_jwt_identity()
         # assert the code is valid
-        if not CodeModel.objects(code=code):
+        code_doc = get_or_none(CodeModel, code=code)
+        if code_doc is None:
             return PromoteUser(ok=BooleanField(boolean=False), user=None)
         else:
-            # get the code object in the database
-            code_doc = CodeModel.objects.get(code=code)
             # delete code as they are one time use
             code_doc.delete()
+            forget(code_doc)
             # get the user object
-            user = UserModel.objects.get(username=username)
+            user = get_current_user()
             # give the user producer access
             user.update(set__producer=True)
             user.save()
@@ -170,8 +182,7 @@ class ChangePassword(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, password):
-        username = get_jwt_identity()
-        user = UserModel.objects.get(username=username)
+        user = get_current_user()
         # password is hashed before saving
         user.update(set__password=generate_password_hash(password))
         user.save()
@@ -199,9 +210,9 @@ class ChangeUsername(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, username):
-        if UserModel.objects(username=username):
+        if get_or_none(UserModel, username=username) is not None:
             return ChangeUsername(ok=BooleanField(boolean=False), user=None, refresh_token=None)
-        user = UserModel.objects.get(username=get_jwt_identity())
+        user = get_current_user()
         user.update(set__username=username)
         user.save()
         user.reload()
@@ -226,8 +237,8 @@ class Auth(Mutation):
     @classmethod
     def mutate(cls, _, info, username, password):
         # assert the login data is valid
-        if not (UserModel.objects(username=username) and check_password_hash(
-                UserModel.objects.get(username=username).password, password)):
+        user = get_or_none(UserModel, username=username)
+        if not (user is not None and check_password_hash(user.password, password)):
             return Auth(ok=False, access_token=None, refresh_token=None)
         else:
             # if login data was valid create and return jwt access and refresh tokens
@@ -275,11 +286,11 @@ class ChooseProfilePicture(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, picture_id):
-        user = UserModel.objects.get(username=get_jwt_identity())
-        if not ProfilePictureModel.objects(id=picture_id):
+        user = get_current_user()
+        picture = get_or_none(ProfilePictureModel, id=picture_id)
+        if picture is None:
             return ChooseProfilePicture(ok=BooleanField(boolean=False))
         else:
-            picture = ProfilePictureModel.objects.get(id=picture_id)
             user.update(set__profile_picture=picture)
             user.save()
             return ChooseProfilePicture(ok=BooleanField(boolean=True))
@@ -309,10 +320,10 @@ class DeleteAccount(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info):
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
+        user = get_current_user()
+        if user is not None:
             user.delete()
+            forget(user)
         return DeleteAccount(ok=BooleanField(boolean=True))
 
 
@@ -354,7 +365,7 @@ class AddFavouriteObject(Mutation):
        Parameters: token, String, valid jwt access token of a user
                    objectId, String, inventory ID of the object to be added
        returns the list of favourites and True if successful
-       returns Null and False if the object does not exist
+       returns Null and False if the object or the account of the token does not exist
        returns Null and an empty value for ok if the token was invalid """
 
     class Arguments:
@@ -367,34 +378,15 @@ class AddFavouriteObject(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, object_id):
-        user = UserModel.objects.get(username=get_jwt_identity())
+        user = get_current_user()
         # assert the object exists
-        if MuseumObjectModel.objects(object_id=object_id):
-            museum_object = MuseumObjectModel.objects.get(object_id=object_id)
-            # check if the user already has a favourites object
-            if FavouritesModel.objects(user=user):
-                favourites = FavouritesModel.objects.get(user=user)
-                # check if user already has other favourite objects
-                if favourites.favourite_objects:
-                    objects = favourites.favourite_objects
-                    # add current object to the list if it is not in it already
-                    if museum_object not in objects:
-                        objects.append(museum_object)
-                        favourites.update(set__favourite_objects=objects)
-                        favourites.save()
-                # if the user does not already have a list of favourite objects make one and add the current object
-                else:
-                    objects = [museum_object]
-                    favourites.update(set__favourite_objects=objects)
-                    favourites.save()
-                favourites.reload()
-                return AddFavouriteObject(ok=BooleanField(boolean=True), favourites=favourites)
-            # if the user does not currently have a Favourites object create one and add the current object to it
-            else:
-                objects = [museum_object]
-                favourites = FavouritesModel(user=user, favourite_objects=objects)
-                favourites.save()
-                return AddFavouriteObject(ok=BooleanField(boolean=True), favourites=favourites)
+        museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+        # the account of the token may have been deleted. upserting with user None would create shared favourites
+        if user is not None and museum_object is not None:
+            # adds the object unless it is already a favourite. creates the favourites of the user if they have none
+            favourites = FavouritesModel.objects(user=user).modify(upsert=True, new=True,
+                                                                   add_to_set__favourite_objects=museum_object)
+            return AddFavouriteObject(ok=BooleanField(boolean=True), favourites=favourites)
         else:
             return AddFavouriteObject(ok=BooleanField(boolean=False), favourites=None)
 
@@ -420,20 +412,13 @@ class RemoveFavouriteObject(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, object_id):
         # get the user object to reference
-        user = UserModel.objects.get(username=get_jwt_identity())
-        # get the user's favourites
-        if FavouritesModel.objects(user=user):
-            favourites = FavouritesModel.objects.get(user=user)
-            # assert the MuseumObject exists
-            if MuseumObjectModel.objects(object_id=object_id):
-                museum_object = MuseumObjectModel.objects.get(object_id=object_id)
-                # if the object is in the user's favourites remove it
-                if museum_object in favourites.favourite_objects:
-                    objects = favourites.favourite_objects
-                    objects.remove(museum_object)
-                    favourites.update(set__favourite_objects=objects)
-                    favourites.save()
-                    favourites.reload()
+        user = get_current_user()
+        # assert the MuseumObject exists
+        museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+        if user is not None and museum_object is not None:
+            # removes the object if it is in the user's favourites. None if the user does not have any favourites
+            favourites = FavouritesModel.objects(user=user).modify(new=True, pull__favourite_objects=museum_object)
+            if favourites is not None:
                 # operation if successful is the object was already not part of the user's favourites
                 return RemoveFavouriteObject(ok=BooleanField(boolean=True), favourites=favourites)
         return RemoveFavouriteObject(ok=BooleanField(boolean=False), favourites=None)
@@ -444,7 +429,7 @@ class AddFavouriteTour(Mutation):
       Parameters: token, String, valid jwt access token of a user
                    tourId, String, document ID of the tour to be added
       returns the updated list of favourites and True if successful.
-      returns Null and False if the tour does not exits
+      returns Null and False if the tour or the account of the token does not exits
       returns Null and an empty value for ok is the token is invalid
     """
 
@@ -459,33 +444,15 @@ class AddFavouriteTour(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id):
         # get user object to reference
-        user = UserModel.objects.get(username=get_jwt_identity())
+        user = get_current_user()
         # assert that tour exists and get the object to reference
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-            # get the users current favourites
-            if FavouritesModel.objects(user=user):
-                favourites = FavouritesModel.objects.get(user=user)
-                if favourites.favourite_tours:
-                    tours = favourites.favourite_tours
-                    # if the tour is not yet in the user's favourite tours add it
-                    if tour not in tours:
-                        tours.append(tour)
-                        favourites.update(set__favourite_tours=tours)
-                        favourites.save()
-                # if the user did not have any favourite tours before create a new list and add the tour to it
-                else:
-                    tours = [tour]
-                    favourites.update(set__favourite_tours=tours)
-                    favourites.save()
-                favourites.reload()
-                return AddFavouriteTour(ok=BooleanField(boolean=True), favourites=favourites)
-            # if the user did not have any favourites before create a new object and add the tour to favourite tours
-            else:
-                tours = [tour]
-                favourites = FavouritesModel(user=user, favourite_tours=tours)
-                favourites.save()
-                return AddFavouriteTour(ok=BooleanField(boolean=True), favourites=favourites)
+        tour = get_or_none(TourModel, id=tour_id)
+        # the account of the token may have been deleted. upserting with user None would create shared favourites
+        if user is not None and tour is not None:
+            # adds the tour unless it is already a favourite. creates the favourites of the user if they have none
+            favourites = FavouritesModel.objects(user=user).modify(upsert=True, new=True,
+                                                                   add_to_set__favourite_tours=tour)
+            return AddFavouriteTour(ok=BooleanField(boolean=True), favourites=favourites)
         else:
             return AddFavouriteTour(ok=BooleanField(boolean=False), favourites=None)
 
@@ -511,20 +478,13 @@ class RemoveFavouriteTour(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id):
         # get user to reference
-        user = UserModel.objects.get(username=get_jwt_identity())
-        # get the user's favourites
-        if FavouritesModel.objects(user=user):
-            favourites = FavouritesModel.objects.get(user=user)
-            # check if tour exists
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
-                # check if tour is in the user's favourites. if it is remove it
-                if tour in favourites.favourite_tours:
-                    tours = favourites.favourite_tours
-                    tours.remove(tour)
-                    favourites.update(set__favourite_tours=tours)
-                    favourites.save()
-                    favourites.reload()
+        user = get_current_user()
+        # check if tour exists
+        tour = get_or_none(TourModel, id=tour_id)
+        if user is not None and tour is not None:
+            # removes the tour if it is in the user's favourites. None if the user does not have any favourites
+            favourites = FavouritesModel.objects(user=user).modify(new=True, pull__favourite_tours=tour)
+            if favourites is not None:
                 # if the tour was not in the user's favourites the call is still successful
                 return RemoveFavouriteTour(ok=BooleanField(boolean=True), favourites=favourites)
         return RemoveFavouriteTour(ok=BooleanField(boolean=False), favourites=None)
@@ -559,10 +519,9 @@ class CreateTour(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, name, session_id, difficulty, search_id, description=None):
-        owner_name = get_jwt_identity()
         # get user object tot reference as owner
-        if UserModel.objects(username=owner_name):
-            owner = UserModel.objects.get(username=owner_name)
+        owner = get_current_user()
+        if owner is not None:
             # owner has to be producer to be allowed to create a tour
             if owner.producer:
                 # owner is automatically the first member of the tour
@@ -572,7 +531,7 @@ class CreateTour(Mutation):
                     difficulty = 1
                 elif difficulty > 5:
                     difficulty = 5
-                if not TourModel.objects(search_id=search_id):
+                if get_or_none(TourModel, search_id=search_id) is None:
                     tour = TourModel(owner=owner, name=name, users=users, session_id=session_id, difficulty=difficulty,
                                      description=description, search_id=search_id)
                     tour.save()
@@ -611,29 +570,22 @@ class CreateCheckpoint(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id, **kwargs):
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-        else:
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is None:
             return CreateCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        user = UserModel.objects.get(username=get_jwt_identity())
-        if not user == tour.owner:
+        user = get_current_user()
+        if not user == get_reference(tour, 'owner'):
             return CreateCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        # add checkpoint to the end of the tour
-        current_index = tour.current_checkpoints
-        current_index += 1
-        tour.update(set__current_checkpoints=current_index)
-        tour.save()
-        tour.reload()
         # handling optional parameters
         text = kwargs.get('text', None)
         show_text = kwargs.get('show_text', False)
         show_picture = kwargs.get('show_picture', False)
         show_details = kwargs.get('show_details', False)
-        # creating checkpoint
-        checkpoint = CheckpointModel(tour=tour, index=current_index, text=text, show_text=show_text,
+        # creating checkpoint and adding it to the end of the tour
+        checkpoint = CheckpointModel(tour=tour, text=text, show_text=show_text,
                                      show_picture=show_picture, show_details=show_details)
-        checkpoint.save()
-        checkpoint.reload()
+        if not append_checkpoints(tour, [checkpoint]):
+            return CreateCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
         return CreateCheckpoint(checkpoint=checkpoint, ok=BooleanField(boolean=True))
 
 
@@ -674,13 +626,12 @@ class CreatePictureCheckpoint(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id, **kwargs):
         # assert tour exists
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-        else:
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is None:
             return CreatePictureCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
         # get user and assert user owns the tour
-        user = UserModel.objects.get(username=get_jwt_identity())
-        if not user == tour.owner:
+        user = get_current_user()
+        if not user == get_reference(tour, 'owner'):
             return CreatePictureCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
         #picture = kwargs.get('picture', None)
         #picture_description = kwargs.get('picture_description', None)
@@ -691,20 +642,15 @@ class CreatePictureCheckpoint(Mutation):
         show_text = kwargs.get('show_text', False)
         show_picture = kwargs.get('show_picture', False)
         show_details = kwargs.get('show_details', False)
-        # add checkpoint to the end of the tour
-        current_index = tour.current_checkpoints
-        current_index += 1
-        tour.update(set__current_checkpoints=current_index)
-        tour.save()
-        tour.reload()
         if picture_id is not None:
-            if PictureModel(id=picture_id):
-                pic = PictureModel.objects.get(id=picture_id)
-                checkpoint = PictureCheckpointModel(picture=pic, tour=tour, text=text, index=current_index,
+            pic = get_or_none(PictureModel, id=picture_id)
+            if pic is not None:
+                checkpoint = PictureCheckpointModel(picture=pic, tour=tour, text=text,
                                                     show_details=show_details, show_picture=show_picture,
                                                     show_text=show_text)
-                checkpoint.save()
-                return CreatePictureCheckpoint(checkpoint=checkpoint, ok=BooleanField(boolean=True))
+                # add checkpoint to the end of the tour
+                if append_checkpoints(tour, [checkpoint]):
+                    return CreatePictureCheckpoint(checkpoint=checkpoint, ok=BooleanField(boolean=True))
         return CreatePictureCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
         #if picture is not None:
             #x = PictureModel(description=picture_description)
@@ -754,28 +700,79 @@ class CreateObjectCheckpoint(Mutation):
         show_text = kwargs.get('show_text', False)
         show_picture = kwargs.get('show_picture', False)
         show_details = kwargs.get('show_details', False)
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-        else:
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is None:
             return CreateObjectCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        user = UserModel.objects.get(username=get_jwt_identity())
-        if not user == tour.owner:
+        user = get_current_user()
+        if not user == get_reference(tour, 'owner'):
             return CreateObjectCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        if not MuseumObjectModel.objects(object_id=object_id):
+        museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+        if museum_object is None:
             return CreateObjectCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        # add checkpoint to the end of the tour
-        current_index = tour.current_checkpoints
-        current_index += 1
-        tour.update(set__current_checkpoints=current_index)
-        tour.save()
-        tour.reload()
-        museum_object = MuseumObjectModel.objects.get(object_id=object_id)
-        checkpoint = ObjectCheckpointModel(tour=tour, museum_object=museum_object, text=text, index=current_index,
+        checkpoint = ObjectCheckpointModel(tour=tour, museum_object=museum_object, text=text,
                                            show_details=show_details, show_picture=show_picture, show_text=show_text)
-        checkpoint.save()
+        # add checkpoint to the end of the tour
+        if not append_checkpoints(tour, [checkpoint]):
+            return CreateObjectCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
         return CreateObjectCheckpoint(checkpoint=checkpoint, ok=BooleanField(boolean=True))
 
 
+class CreateObjectCheckpoints(Mutation):
+    """
+        Creates one Checkpoint for each of several Objects at once, e.g. when the editor adds a selection of objects.
+        The checkpoints are appended to the tour in the order of object_ids with one update of the tour and one insert.
+        Parameters:
+            token, String, valid jwt access token of the tour owner
+            tour_id, String, id of a tour to add the checkpoints to
+            object_ids, List of String, object_id of the objects to reference, one checkpoint per entry
+            show_text: Boolean, optional, default False, applies to all created checkpoints
+            show_picture: Boolean, optional, default False, applies to all created checkpoints
+            show_details: Boolean, optional, default False, applies to all created checkpoints
+        if successful returns the created checkpoints and True
+        if unsuccessful because the token was invalid returns an empty value for ok
+        returns Null and False if unsuccessful because
+            user did not own the tour
+            tour reference did not exist
+            object_ids was empty or a referenced object did not exist. no checkpoint is created in that case
+    """
+    class Arguments:
+        token = String(required=True)
+        tour_id = String(required=True)
+        object_ids = List(of_type=String, required=True)
+        show_text = Boolean()
+        show_picture = Boolean()
+        show_details = Boolean()
+
+    ok = Field(ProtectedBool)
+    checkpoints = List(lambda: ObjectCheckpoint)
+
+    @classmethod
+    @mutation_jwt_required
+    def mutate(cls, _, info, tour_id, object_ids, **kwargs):
+        # get optional arguments
+        show_text = kwargs.get('show_text', False)
+        show_picture = kwargs.get('show_picture', False)
+        show_details = kwargs.get('show_details', False)
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is None or not object_ids:
+            return CreateObjectCheckpoints(checkpoints=None, ok=BooleanField(boolean=False))
+        user = get_current_user()
+        if not user == get_reference(tour, 'owner'):
+            return CreateObjectCheckpoints(checkpoints=None, ok=BooleanField(boolean=False))
+        museum_objects = {museum_object.object_id: museum_object
+                          for museum_object in MuseumObjectModel.objects(object_id__in=object_ids)}
+        if not all(object_id in museum_objects for object_id in object_ids):
+            return CreateObjectCheckpoints(checkpoints=None, ok=BooleanField(boolean=False))
+        checkpoints = [ObjectCheckpointModel(tour=tour, museum_object=museum_objects[object_id],
+                                             show_details=show_details, show_picture=show_picture,
+                                             show_text=show_text)
+                       for object_id in object_ids]
+        # add checkpoints to the end of the tour
+        if not append_checkpoints(tour, checkpoints):
+            return CreateObjectCheckpoints(checkpoints=None, ok=BooleanField(boolean=False))
+        return CreateObjectCheckpoints(checkpoints=checkpoints, ok=BooleanField(boolean=True))
+
+
 class CreateAnswer(Mutation):
     """
         Creates an Answer to a regular text question
@@ -801,26 +798,23 @@ class CreateAnswer(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, answer, question_id):
         # get user object to reference
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
+        user = get_current_user()
+        if user is not None:
             # assert question exists
-            if QuestionModel.objects(id=question_id):
-                question = QuestionModel.objects.get(id=question_id)
-            else:
+            question = get_or_none(QuestionModel, id=question_id)
+            if question is None:
                 return CreateAnswer(answer=None, ok=BooleanField(boolean=False))
-            # ensure user is member of the tour
-            tour = question.tour
-            if user not in tour.users:
+            # ensure user is member of the tour. the tour itself is not needed
+            if not is_member(question._data.get('tour'), user):
                 return CreateAnswer(answer=None, ok=BooleanField(boolean=False))
             # creating and submitting a new answer
-            if not AnswerModel.objects(question=question, user=user):
+            prev = get_or_none(AnswerModel, question=question, user=user)
+            if prev is None:
                 answer = AnswerModel(question=question, user=user, answer=answer)
                 answer.save()
                 return CreateAnswer(answer=answer, ok=BooleanField(boolean=True))
             # if the user previously answered the question update the answer
             else:
-                prev = AnswerModel.objects.get(question=question, user=user)
                 prev.update(set__answer=answer)
                 prev.reload()
                 return CreateAnswer(answer=prev, ok=BooleanField(boolean=True))
@@ -854,18 +848,15 @@ class CreateMCAnswer(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, answer, question_id):
         # get user object to reference
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
+        user = get_current_user()
+        if user is not None:
             # assert question exists
-            if MCQuestionModel.objects(id=question_id):
-                question = MCQuestionModel.objects.get(id=question_id)
-            else:
-                return CreateAnswer(answer=None, ok=BooleanField(boolean=False), correct=0)
-            # ensuring user is member of the tour
-            tour = question.tour
-            if user not in tour.users:
-                return CreateAnswer(answer=None, ok=BooleanField(boolean=False), correct=0)
+            question = get_or_none(MCQuestionModel, id=question_id)
+            if question is None:
+                return CreateMCAnswer(answer=None, ok=BooleanField(boolean=False), correct=0)
+            # ensuring user is member of the tour. the tour itself is not needed
+            if not is_member(question._data.get('tour'), user):
+                return CreateMCAnswer(answer=None, ok=BooleanField(boolean=False), correct=0)
             # creating and submitting a new answer
             #if not MCAnswerModel.objects(question=question, user=user):
                 # number of answers may not be more than permitted by the question
@@ -875,10 +866,10 @@ class CreateMCAnswer(Mutation):
             for single_answer in answer:
                 if single_answer in correct_answers:
                     correct += 1
-            if not MCAnswerModel.objects(question=question, user=user):
+            answer_ = get_or_none(MCAnswerModel, question=question, user=user)
+            if answer_ is None:
                 answer_ = MCAnswerModel(question=question, user=user, answer=answer)
             else:
-                answer_ = MCAnswerModel.objects.get(question=question, user=user)
                 answer_.update(set__answer=answer)
             answer_.save()
             answer_.reload()
@@ -933,34 +924,29 @@ class CreateQuestion(Mutation):
         if linked_objects is None:
             linked_objects = []
         # get the current user object to check for permissions
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
+        user = get_current_user()
+        if user is not None:
             # assert that tour exists
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
                 # assert user is owner of the tour
-                if tour.owner == user:
+                if get_reference(tour, 'owner') == user:
                     # resolve references to linked objects if any are given:
                     links = []
                     if linked_objects:
                         for object_id in linked_objects:
-                            if MuseumObjectModel.objects(object_id=object_id):
-                                museum_object = MuseumObjectModel.objects.get(object_id=object_id)
+                            museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+                            if museum_object is not None:
                                 links.append(museum_object)
                             else:
                                 return CreateQuestion(question=None, ok=BooleanField(boolean=False))
 
-                    # add checkpoint to the end of the tour
-                    current_index = tour.current_checkpoints
-                    current_index += 1
-                    tour.update(set__current_checkpoints=current_index)
-                    tour.save()
-                    tour.reload()
                     question = QuestionModel(linked_objects=links,
-                                             question=question_text, text=text, tour=tour, index=current_index,
+                                             question=question_text, text=text, tour=tour,
                                              show_details=show_details, show_picture=show_picture, show_text=show_text)
-                    question.save()
+                    # add checkpoint to the end of the tour
+                    if not append_checkpoints(tour, [question]):
+                        return CreateQuestion(question=None, ok=BooleanField(boolean=False))
                     return CreateQuestion(question=question,
                                           ok=BooleanField(boolean=True))
 
@@ -1015,35 +1001,30 @@ class CreateMCQuestion(Mutation):
         show_details = kwargs.get('show_details', False)
         text = kwargs.get('text', None)
         # get the current user object to check for permissions
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
+        user = get_current_user()
+        if user is not None:
             # assert that tour exists
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
                 # assert user is owner of the tour
-                if tour.owner == user:
+                if get_reference(tour, 'owner') == user:
                     links = []
                     if linked_objects:
                         for object_id in linked_objects:
-                            if MuseumObjectModel.objects(object_id=object_id):
-                                museum_object = MuseumObjectModel.objects.get(object_id=object_id)
+                            museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+                            if museum_object is not None:
                                 links.append(museum_object)
                             else:
                                 return CreateMCQuestion(question=None, ok=BooleanField(boolean=False))
 
-                    # add checkpoint to the end of the tour
-                    current_index = tour.current_checkpoints
-                    current_index += 1
-                    tour.update(set__current_checkpoints=current_index)
-                    tour.save()
-                    tour.reload()
                     question = MCQuestionModel(linked_objects=links,
                                                question=question_text, possible_answers=possible_answers,
                                                correct_answers=correct_answers, max_choices=max_choices, tour=tour,
-                                               index=current_index, show_text=show_text, show_picture=show_picture,
+                                               show_text=show_text, show_picture=show_picture,
                                                show_details=show_details, text=text)
-                    question.save()
+                    # add checkpoint to the end of the tour
+                    if not append_checkpoints(tour, [question]):
+                        return CreateMCQuestion(question=None, ok=BooleanField(boolean=False))
                     return CreateMCQuestion(question=question,
                                             ok=BooleanField(boolean=True))
 
@@ -1072,25 +1053,19 @@ class AddMember(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id, **kwargs):
         # assert tour exists
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
             # assert the provided session id is valid for the tour
             session_id = kwargs.get('session_id', None)
             # featured tours can also be joined by anyone without session id
             if tour.session_id == session_id or tour.status == 'featured':
-                username = get_jwt_identity()
                 # get user object to reference in the users list of the tour
-                if UserModel.objects(username=username):
-                    user = UserModel.objects.get(username=username)
-                    users = tour.users
+                user = get_current_user()
+                if user is not None:
                     # add user to tour
-                    if user not in users:
-                        users.append(user)
-                        tour.update(set__users=users)
-                        tour.save()
-                        tour.reload()
                     # if the user was already a member of the tour nothing changes and the call is still successful
-                    return AddMember(ok=BooleanField(boolean=True), tour=tour)
+                    tour = add_member(tour, user)
+                    return AddMember(ok=BooleanField(boolean=tour is not None), tour=tour)
                 else:
                     return AddMember(ok=BooleanField(boolean=False), tour=None)
             else:
@@ -1120,11 +1095,10 @@ class SubmitReview(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id):
         # assert tour exists
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-            username = get_jwt_identity()
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
             # assert user is the owner of the tour
-            if tour.owner.username == username:
+            if get_reference(tour, 'owner') == get_current_user():
                 # setting status of the tour to pending will make the request for review show up for admins
                 tour.update(set__status='pending')
                 tour.save()
@@ -1159,11 +1133,10 @@ class UpdateSessionId(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id, session_id):
         # assert tour exists
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-            username = get_jwt_identity()
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
             # assert caller is the owner of the tour
-            if tour.owner.username == username:
+            if get_reference(tour, 'owner') == get_current_user():
                 tour.update(set__session_id=session_id)
                 tour.save()
                 tour.reload()
@@ -1198,23 +1171,16 @@ class RemoveUser(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id, username):
         # assert tour exists
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-            owner = get_jwt_identity()
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
             # assert caller is the owner of the tour
-            if tour.owner.username == owner:
+            if get_reference(tour, 'owner') == get_current_user():
                 # assert the user the caller wants to kick exists
-                if UserModel.objects(username=username):
-                    user = UserModel.objects.get(username=username)
-                    users = tour.users
-                    # if user is a member remove him
-                    if user in users:
-                        users.remove(user)
+                user = get_or_none(UserModel, username=username)
+                if user is not None:
                     # if the user was not a member of the tour nothing changes and the function call is still successful
-                    tour.update(set__users=users)
-                    tour.save()
-                    tour.reload()
-                    return RemoveUser(tour=tour, ok=BooleanField(boolean=True))
+                    tour = remove_member(tour, user)
+                    return RemoveUser(tour=tour, ok=BooleanField(boolean=tour is not None))
                 else:
                     return RemoveUser(tour=None, ok=BooleanField(boolean=False))
             else:
@@ -1249,12 +1215,12 @@ class SubmitFeedback(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, rating, tour_id, review):
         # assert tour exists
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
             # get user object to use as reference in the feedback
-            if UserModel.objects(username=get_jwt_identity()):
-                user = UserModel.objects.get(username=get_jwt_identity())
-                if user in tour.users:
+            user = get_current_user()
+            if user is not None:
+                if is_member(tour, user):
                     # assert rating is valid on the 1-5 scale
                     if rating < 1:
                         rating = 1
@@ -1275,11 +1241,12 @@ class SubmitFeedback(Mutation):
 class MoveCheckpoint(Mutation):
     """
         Change the index of a given checkpoint in its tour. Can only be used by the tour owner. Indices of other
-        checkpoints in the tour are automatically adjusted accordingly.
+        checkpoints in the tour are automatically adjusted accordingly as they are computed from the ranks of the
+        checkpoints, see app.Checkpoints.
         Parameters:
                 token: String, valid jwt access token
                 checkpoint_id: String, document id of the checkpoint to move
-                index: Int, the index to put the checkpoint at. values greater than the current_checkpoints field of the
+                index: Int, the index to put the checkpoint at. values greater than the number of checkpoints in the
                     tour move the checkpoint to the end. -1 also moves the checkpoint to the end
         if successful returns the updated checkpoint and True
         if unsuccessful because the id was invalid or the user is not the owner of the tour returns Null and False
@@ -1295,56 +1262,17 @@ class MoveCheckpoint(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, checkpoint_id, index):
-        user = UserModel.objects.get(username=get_jwt_identity())
+        user = get_current_user()
         # assert checkpoint exists
-        if not CheckpointModel.objects(id=checkpoint_id):
+        checkpoint = get_or_none(CheckpointModel, id=checkpoint_id)
+        if checkpoint is None:
             return MoveCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        checkpoint = CheckpointModel.objects.get(id=checkpoint_id)
-        tour = checkpoint.tour
+        tour = get_reference(checkpoint, 'tour')
         # assert user owns the tour
-        if tour.owner != user:
+        if get_reference(tour, 'owner') != user:
             return MoveCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        current_index = checkpoint.index
-        max_index = tour.current_checkpoints
-        checkpoints = CheckpointModel.objects(tour=tour)
-        checkpoints = checkpoints(id__ne=checkpoint_id)
-        # move checkpoint to the end of the list
-        if index == -1 or index >= max_index:
-            checkpoint.update(set__index=max_index)
-            checkpoint.save()
-            checkpoint.reload()
-            for cp in checkpoints():
-                # move all checkpoints coming after the old index one back
-                if cp.index > current_index:
-                    cpidx = cp.index
-                    cpidx -= 1
-                    cp.update(set__index=cpidx)
-                    cp.save()
-                    cp.reload()
-        # move all checkpoints between the new and old
-        elif index < current_index:
-            checkpoint.update(set__index=index)
-            checkpoint.save()
-            checkpoint.reload()
-            for cp in checkpoints():
-                if current_index > cp.index >= index:
-                    cpidx = cp.index
-                    cpidx += 1
-                    cp.update(set__index=cpidx)
-                    cp.save()
-                    cp.reload()
-        # move all checkpoints between old and new index one
-        elif index > current_index:
-            checkpoint.update(set__index=index)
-            checkpoint.save()
-            checkpoint.reload()
-            for cp in checkpoints():
-                if current_index < cp.index <= index:
-                    cpidx = cp.index
-                    cpidx -= 1
-                    cp.update(set__index=cpidx)
-                    cp.save()
-                    cp.reload()
+        move_checkpoint(checkpoint, index)
+        checkpoint.reload()
         return MoveCheckpoint(checkpoint=checkpoint, ok=BooleanField(boolean=True))
 
 
@@ -1368,30 +1296,17 @@ class DeleteCheckpoint(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, checkpoint_id):
-        if CheckpointModel.objects(id=checkpoint_id):
-            checkpoint = CheckpointModel.objects.get(id=checkpoint_id)
+        checkpoint = get_or_none(CheckpointModel, id=checkpoint_id)
         # successful if checkpoint does not exist
-        else:
+        if checkpoint is None:
             return DeleteCheckpoint(ok=BooleanField(boolean=True))
-        tour = checkpoint.tour
-        user = UserModel.objects.get(username=get_jwt_identity())
+        tour = get_reference(checkpoint, 'tour')
+        user = get_current_user()
         # assert user owns the tour and thus the checkpoint
-        if user == tour.owner:
-            index = checkpoint.index
-            checkpoints = CheckpointModel.objects(tour=tour)
-            # update the indices of following checkpoints accordingly
-            for cp in checkpoints:
-                if cp.index > index:
-                    cpidx = cp.index
-                    cpidx -= 1
-                    cp.update(set__index=cpidx)
-                    cp.save()
-                    cp.reload()
-            # update the total number of checkpoints in the tour
-            max_index = tour.current_checkpoints
-            max_index -= 1
-            tour.update(set__current_checkpoints=max_index)
-            checkpoint.delete()
+        if user == get_reference(tour, 'owner'):
+            # only reduces the number of checkpoints in the tour. indices follow from the ranks of the rest
+            delete_checkpoint(checkpoint)
+            forget(checkpoint)
             return DeleteCheckpoint(ok=BooleanField(boolean=True))
         else:
             return DeleteCheckpoint(ok=BooleanField(boolean=False))
@@ -1446,14 +1361,13 @@ class EditCheckpoint(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, checkpoint_id, **kwargs):
         # assert checkpoint exists
-        if not CheckpointModel.objects(id=checkpoint_id):
+        checkpoint = get_or_none(CheckpointModel, id=checkpoint_id)
+        if checkpoint is None:
             return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        # get checkpoint object
-        checkpoint = CheckpointModel.objects.get(id=checkpoint_id)
         # assert caller owns the tour and thus the checkpoint
-        tour = checkpoint.tour
-        user = UserModel.objects.get(username=get_jwt_identity())
-        if user != tour.owner:
+        tour = get_reference(checkpoint, 'tour')
+        user = get_current_user()
+        if user != get_reference(tour, 'owner'):
             return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
         # get all the optional arguments
         text = kwargs.get('text', None)
@@ -1482,9 +1396,9 @@ class EditCheckpoint(Mutation):
         if isinstance(checkpoint, ObjectCheckpointModel):
             # assert new object exists
             if object_id is not None:
-                if not MuseumObjectModel.objects(object_id=object_id):
+                museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+                if museum_object is None:
                     return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-                museum_object = MuseumObjectModel.objects.get(object_id=object_id)
                 checkpoint.update(set__museum_object=museum_object)
             checkpoint.save()
             checkpoint.reload()
@@ -1492,9 +1406,9 @@ class EditCheckpoint(Mutation):
         elif isinstance(checkpoint, PictureCheckpointModel):
             # assert new picture exists
             if picture_id is not None:
-                if not PictureModel.objects(id=picture_id):
+                pic = get_or_none(PictureModel, id=picture_id)
+                if pic is None:
                     return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-                pic = PictureModel.objects.get(id=picture_id)
                 checkpoint.update(set__picture=pic)
             if text is not None:
                 checkpoint.update(set__text=text)
@@ -1516,10 +1430,11 @@ class EditCheckpoint(Mutation):
             if linked_objects is not None:
                 new_links = []
                 for oid in linked_objects:
-                    if not MuseumObjectModel.objects(object_id=oid):
+                    museum_object = get_or_none(MuseumObjectModel, object_id=oid)
+                    if museum_object is None:
                         return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
                     else:
-                        new_links.append(MuseumObjectModel.objects.get(object_id=oid))
+                        new_links.append(museum_object)
                 checkpoint.update(set__linked_objects=new_links)
             checkpoint.save()
             checkpoint.reload()
@@ -1530,10 +1445,11 @@ class EditCheckpoint(Mutation):
             if linked_objects is not None:
                 new_links = []
                 for oid in linked_objects:
-                    if not MuseumObjectModel.objects(object_id=oid):
+                    museum_object = get_or_none(MuseumObjectModel, object_id=oid)
+                    if museum_object is None:
                         return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
                     else:
-                        new_links.append(MuseumObjectModel.objects.get(object_id=oid))
+                        new_links.append(museum_object)
                 checkpoint.update(set__linked_objects=new_links)
             checkpoint.save()
             checkpoint.reload()
@@ -1566,10 +1482,12 @@ class Mutation(ObjectType):
     remove_user = RemoveUser.Field()
     submit_tour_feedback = SubmitFeedback.Field()
     add_badge_progress = AddBadgeProgress.Field()
+    add_badge_progress_batch = AddBadgeProgressBatch.Field()
     choose_profile_picture = ChooseProfilePicture.Field()
     create_checkpoint = CreateCheckpoint.Field()
     create_picture_checkpoint = CreatePictureCheckpoint.Field()
     create_object_checkpoint = CreateObjectCheckpoint.Field()
+    create_object_checkpoints = CreateObjectCheckpoints.Field()
     edit_checkpoint = EditCheckpoint.Field()
     move_checkpoint = MoveCheckpoint.Field()
     delete_checkpoint = DeleteCheckpoint.Field()
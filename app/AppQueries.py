@@ -1,6 +1,16 @@
-from flask_graphql_auth import get_jwt_identity, query_jwt_required
-from graphene import ObjectType, List, String, Int
-from app.Fields import User, Tour, MuseumObject, TourFeedback, CheckpointUnion, AnswerUnion, Badge
+from flask_graphql_auth import query_jwt_required, get_jwt_identity
+from graphene import ObjectType, List, String, Int, Field
+from app.Fields import User, Tour, MuseumObject, TourFeedback, CheckpointUnion, AnswerUnion, Badge, \
+    TourConnection, MuseumObjectConnection, TourFeedbackConnection, AnswerConnection, MuseumObjectSearchConnection, \
+    ObjectFacets
+from app.Loaders import get_or_none, get_current_user, get_reference
+from app.Projection import project
+from app.Pagination import paginate, connection
+from app.Export import text_lines, user_rows
+from app.Checkpoints import in_order, number, checkpoint_at
+from app.Members import is_member
+from app.Search import search
+from app.Facets import object_facets
 from models.User import User as UserModel
 from models.Tour import Tour as TourModel
 from models.Favourites import Favourites as FavouritesModel
@@ -12,7 +22,6 @@ from models.Question import Question as QuestionModel
 from models.Answer import Answer as AnswerModel
 from models.Badge import Badge as BadgeModel
 from models.MultipleChoiceQuestion import MultipleChoiceQuestion as MCQuestionModel
-from models.MultipleChoiceAnswer import MultipleChoiceAnswer as MCAnswerModel
 """
     These are the queries available to the App API. 
     Included queries: 
@@ -26,8 +35,51 @@ from models.MultipleChoiceAnswer import MultipleChoiceAnswer as MCAnswerModel
         all answers to a certain question 
         all answers by a certain user 
         all my answers     
+    Queries returning whole collections also have a paginated *_connection version.
 """
 
+# fields of MuseumObject the museum_object queries can filter by. size is stored as size_
+MUSEUM_OBJECT_FILTERS = ('object_id', 'category', 'sub_category', 'title', 'year', 'art_type', 'creator', 'material',
+                         'time_range', 'location', 'description', 'interdisciplinary_context', 'additional_information',
+                         'size')
+
+
+def museum_object_arguments():
+    """ returns the arguments of the museum_object queries of the app and web API """
+    return {name: String() for name in MUSEUM_OBJECT_FILTERS}
+
+
+def filter_museum_objects(kwargs):
+    """ returns the museum objects matching all filters given in kwargs. filters that are None are ignored """
+    filters = {}
+    for name in MUSEUM_OBJECT_FILTERS:
+        if kwargs.get(name) is not None:
+            filters['size_' if name == 'size' else name] = kwargs[name]
+    return MuseumObjectModel.objects(**filters)
+
+
+def _favourite_ids(field_name):
+    """
+        returns the ids in field_name of the favourites of the current user or None if the user does not have any.
+        users and favourites share the user database, so both are read with one $lookup
+    """
+    pipeline = [{'$match': {'username': get_jwt_identity()}},
+                {'$lookup': {'from': FavouritesModel._get_collection_name(),
+                             'localField': '_id',
+                             'foreignField': '_id',
+                             'as': 'favourites'}},
+                {'$project': {'favourites.' + field_name: 1}}]
+    for user in UserModel.objects.aggregate(*pipeline):
+        if user['favourites']:
+            return user['favourites'][0].get(field_name, [])
+    return None
+
+
+def _in_order(queryset, ids):
+    # one $in query. references to deleted documents are dropped
+    documents = queryset.in_bulk(ids)
+    return [documents[pk] for pk in ids if pk in documents]
+
 
 class Query(ObjectType):
     """ returns the current user's favourite tours """
@@ -38,21 +90,17 @@ class Query(ObjectType):
     @classmethod
     @query_jwt_required
     def resolve_favourite_tours(cls, _, info):
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            if FavouritesModel.objects(user=user):
-                return list(FavouritesModel.objects.get(user=user).favourite_tours)
+        tours = _favourite_ids('favourite_tours')
+        if tours is not None:
+            return _in_order(project(TourModel.objects, info), tours)
         return None
 
     @classmethod
     @query_jwt_required
     def resolve_favourite_objects(cls, _, info):
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            if FavouritesModel.objects(user=user):
-                return list(FavouritesModel.objects.get(user=user).favourite_objects)
+        museum_objects = _favourite_ids('favourite_objects')
+        if museum_objects is not None:
+            return _in_order(project(MuseumObjectModel.objects, info), museum_objects)
         return None
 
         # queries related to tours
@@ -71,7 +119,7 @@ class Query(ObjectType):
     owned_tours = List(Tour, token=String())
     """Returns all feedback submitted for a tour. Can only be queried by the Tour owner."""
     feedback = List(TourFeedback, token=String(), tour_id=String())
-    """returns all checkpoints that are part of the tour """
+    """returns all checkpoints that are part of the tour in their order """
     checkpoints_tour = List(CheckpointUnion, token=String(), tour_id=String())
     """returns a single tour by search_id"""
     tour_search_id = List(String, token=String(), search_id=String())
@@ -79,63 +127,93 @@ class Query(ObjectType):
     checkpoint_id = List(CheckpointUnion, token=String(), checkpoint_id=String())
     """returns all featured tours"""
     featured = List(Tour, token=String())
+    """ paginated versions of featured, my_tours, owned_tours and feedback. see app.Pagination """
+    featured_connection = Field(TourConnection, token=String(), first=Int(), after=String())
+    my_tours_connection = Field(TourConnection, token=String(), first=Int(), after=String())
+    owned_tours_connection = Field(TourConnection, token=String(), first=Int(), after=String())
+    feedback_connection = Field(TourFeedbackConnection, token=String(), tour_id=String(), first=Int(), after=String())
 
     @classmethod
     @query_jwt_required
     def resolve_featured(cls, _, info):
-        return list(TourModel.objects(status='featured'))
+        return list(project(TourModel.objects(status='featured'), info))
+
+    @classmethod
+    @query_jwt_required
+    def resolve_featured_connection(cls, _, info, first=None, after=None):
+        return connection(TourConnection, TourModel.objects(status='featured'), info, first, after)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_my_tours_connection(cls, _, info, first=None, after=None):
+        user = get_current_user()
+        if user is not None:
+            return connection(TourConnection, TourModel.objects(users__contains=user), info, first, after)
+        return connection(TourConnection, None)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_owned_tours_connection(cls, _, info, first=None, after=None):
+        user = get_current_user()
+        if user is not None:
+            return connection(TourConnection, TourModel.objects(owner=user), info, first, after)
+        return connection(TourConnection, None)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_feedback_connection(cls, _, info, tour_id, first=None, after=None):
+        user = get_current_user()
+        if user is not None:
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None and get_reference(tour, 'owner') == user:
+                return connection(TourFeedbackConnection, TourFeedbackModel.objects(tour=tour), info, first, after)
+        return connection(TourFeedbackConnection, None)
 
     @classmethod
     @query_jwt_required
     def resolve_my_tours(cls, _, info):
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            return list(TourModel.objects(users__contains=user))
+        user = get_current_user()
+        if user is not None:
+            return list(project(TourModel.objects(users__contains=user), info))
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_tour(cls, _, info, tour_id):
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
-                if user in tour.users:
+        user = get_current_user()
+        if user is not None:
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
+                if is_member(tour, user):
                     return [tour]
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_owned_tours(cls, _, info):
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            return list(TourModel.objects(owner=user))
+        user = get_current_user()
+        if user is not None:
+            return list(project(TourModel.objects(owner=user), info))
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_feedback(cls, _, info, tour_id):
-        username = get_jwt_identity()
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
-            if tour.owner == user:
-                return list(TourFeedbackModel.objects(tour=tour))
+        user = get_current_user()
+        if user is not None:
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None and get_reference(tour, 'owner') == user:
+                return list(project(TourFeedbackModel.objects(tour=tour), info))
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_checkpoints_tour(cls, _, info, tour_id):
-        user = UserModel.objects.get(username=get_jwt_identity())
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-            if user in tour.users:
-                if CheckpointModel.objects(tour=tour):
-                    return list(CheckpointModel.objects(tour=tour))
+        user = get_current_user()
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
+            if is_member(tour, user):
+                return number(project(in_order(tour), info))
         return []
 
     @classmethod
@@ -145,19 +223,19 @@ class Query(ObjectType):
         The id can be used in combination with the session id to join the tour. Users that are a member of a tour can
          use the id of the tour to get the tour object which allows for further retrieval of tour fields and checkpoints
          """
-        if TourModel.objects(search_id=search_id):
-            tour = TourModel.objects.get(search_id=search_id)
+        tour = get_or_none(TourModel, search_id=search_id)
+        if tour is not None:
             return [tour.id]
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_checkpoint_id(cls, _, info, checkpoint_id):
-        user = UserModel.objects.get(username=get_jwt_identity())
-        if CheckpointModel.objects(id=checkpoint_id):
-            checkpoint = CheckpointModel.objects.get(id=checkpoint_id)
-            tour = checkpoint.tour
-            if user == tour.owner:
+        user = get_current_user()
+        checkpoint = get_or_none(CheckpointModel, id=checkpoint_id)
+        if checkpoint is not None:
+            tour = get_reference(checkpoint, 'tour')
+            if user == get_reference(tour, 'owner'):
                 return [checkpoint]
         return []
 
@@ -167,75 +245,51 @@ class Query(ObjectType):
         accepts as few or many as needed. in the current iteration all text fields have to be queried using the EXACT 
         value in the database.
     """
-    museum_object = List(MuseumObject, object_id=String(),
-                         category=String(),
-                         sub_category=String(),
-                         title=String(),
-                         token=String(required=True),
-                         year=String(),
-                         art_type=String(),
-                         creator=String(),
-                         material=String(),
-                         time_range=String(),
-                         location=String(),
-                         description=String(),
-                         interdisciplinary_context=String(),
-                         additional_information=String(),
-                         size=String())
+    museum_object = List(MuseumObject, token=String(required=True), **museum_object_arguments())
+    """ paginated versions of all_objects and museum_object. see app.Pagination """
+    all_objects_connection = Field(MuseumObjectConnection, token=String(), first=Int(), after=String())
+    museum_object_connection = Field(MuseumObjectConnection, token=String(required=True), first=Int(), after=String(),
+                                     **museum_object_arguments())
+    """ full text search over title, creator, material, description and interdisciplinary context. best matches
+        first, paginated by first and after. the other parameters restrict the results like those of museum_object.
+        see app.Search
+    """
+    search_objects = Field(MuseumObjectSearchConnection, token=String(required=True), query=String(required=True),
+                           first=Int(), after=String(), **museum_object_arguments())
+    """ numbers of objects per category, sub category, art type, material and creator among the objects matching the
+        parameters, which filter like those of museum_object. meant for browsing the catalogue
+    """
+    object_facets = Field(ObjectFacets, token=String(required=True), **museum_object_arguments())
 
     @classmethod
     @query_jwt_required
     def resolve_all_objects(cls, _, info):
-        return MuseumObjectModel.objects.all()
+        return project(MuseumObjectModel.objects, info)
 
     @classmethod
     @query_jwt_required
     def resolve_museum_object(cls, _, info, **kwargs):
-        object_id = kwargs.get('object_id', None)
-        category = kwargs.get('category', None)
-        sub_category = kwargs.get('sub_category', None)
-        title = kwargs.get('title', None)
-        year = kwargs.get('year', None)
-        art_type = kwargs.get('art_type', None)
-        creator = kwargs.get('creator', None)
-        material = kwargs.get('material', None)
-        location = kwargs.get('location', None)
-        description = kwargs.get('description', None)
-        interdisciplinary_context = kwargs.get('interdisciplinary_context', None)
-        time_range = kwargs.get('time_range', None)
-        additional_information = kwargs.get('additional_information', None)
-        size = kwargs.get('size', None)
-
-        result = MuseumObjectModel.objects.all()
-        if object_id is not None:
-            result = result(object_id=object_id)
-        if category is not None:
-            result = result(category=category)
-        if sub_category is not None:
-            result = result(sub_category=sub_category)
-        if title is not None:
-            result = result(title=title)
-        if year is not None:
-            result = result(year=year)
-        if art_type is not None:
-            result = result(art_type=art_type)
-        if creator is not None:
-            result = result(creator=creator)
-        if material is not None:
-            result = result(material=material)
-        if time_range is not None:
-            result = result(time_range=time_range)
-        if location is not None:
-            result = result(location=location)
-        if description is not None:
-            result = result(description=description)
-        if interdisciplinary_context is not None:
-            result = result(interdisciplinary_context=interdisciplinary_context)
-        if additional_information is not None:
-            result = result(additional_information=additional_information)
-        if size is not None:
-            result = result(size_=size)
-        return list(result)
+        return list(project(filter_museum_objects(kwargs), info))
+
+    @classmethod
+    @query_jwt_required
+    def resolve_all_objects_connection(cls, _, info, first=None, after=None):
+        return connection(MuseumObjectConnection, MuseumObjectModel.objects, info, first, after)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_museum_object_connection(cls, _, info, first=None, after=None, **kwargs):
+        return connection(MuseumObjectConnection, filter_museum_objects(kwargs), info, first, after)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_search_objects(cls, _, info, query, first=None, after=None, **kwargs):
+        return search(filter_museum_objects(kwargs), query, first, after)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_object_facets(cls, _, info, **kwargs):
+        return object_facets(filter_museum_objects(kwargs))
 
     """ returns the current user as object allowing to query e.g. the profile picture id"""
     me = List(User, token=String())
@@ -251,42 +305,46 @@ class Query(ObjectType):
     @classmethod
     @query_jwt_required
     def resolve_available_badges(cls, _, info):
-        return BadgeModel.objects.all()
+        return project(BadgeModel.objects, info)
 
     @classmethod
     @query_jwt_required
     def resolve_available_profile_pictures(cls, _, info):
-        ids = []
-        for pic in ProfilePictureModel.objects.all():
-            ids.append(pic.id)
-        return ids
+        return list(ProfilePictureModel.objects.scalar('id'))
 
     @classmethod
     @query_jwt_required
     def resolve_me(cls, _, info):
-        return [UserModel.objects.get(username=get_jwt_identity())]
+        return [get_current_user()]
 
     @classmethod
     @query_jwt_required
     def resolve_profile_picture(cls, _, info, username):
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
+        user = get_or_none(UserModel, username=username)
+        if user is not None:
             pic_id = user.profile_picture.id
             return [pic_id]
         return []
 
-    """ returns all answers the user has submitted to questions in a given tour """
-    answers_in_tour = List(AnswerUnion, token=String(), tour_id=String())
+    """ returns all answers the user has submitted to questions in a given tour.
+        paginated with first and after, after being the id of the last answer of the previous page
+    """
+    answers_in_tour = List(AnswerUnion, token=String(), tour_id=String(), first=Int(), after=String())
     """ returns the current user's answer to a given question """
     answer = List(AnswerUnion, token=String(), question_id=String())
     """ returns all answers given to a certain question.
         can only be called by the owner of the tour the question is in
     """
     answers_to_question = List(AnswerUnion, token=String(), question_id=String())
+    """ paginated version of answers_to_question. see app.Pagination """
+    answers_to_question_connection = Field(AnswerConnection, token=String(), question_id=String(), first=Int(),
+                                           after=String())
     """ returns a given user's answer to all questions in a tour. 
         can only be called by the owner of the tour the question is in 
+        paginated with first and after like answers_in_tour
     """
-    answers_by_user = List(AnswerUnion, token=String(), username=String(), tour_id=String())
+    answers_by_user = List(AnswerUnion, token=String(), username=String(), tour_id=String(), first=Int(),
+                           after=String())
     """ given a tour id and an index returns the id of the checkpoint if and only if the checkpoint is a Question or 
         MCQuestion
     """
@@ -295,62 +353,68 @@ class Query(ObjectType):
     @classmethod
     @query_jwt_required
     def resolve_question_id(cls, _, info, tour_id, index):
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-            if CheckpointModel.objects(tour=tour, index=index):
-                checkpoint = CheckpointModel.objects.get(tour=tour, index=index)
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
+            checkpoint = checkpoint_at(tour, index)
+            if checkpoint is not None:
                 if type(checkpoint) == MCQuestionModel or type(checkpoint) == QuestionModel:
                     return [checkpoint.id]
         return []
 
     @classmethod
     @query_jwt_required
-    def resolve_answers_in_tour(cls, _, info, tour_id):
-        if TourModel.objects(id=tour_id):
-            tour = TourModel.objects.get(id=tour_id)
-            questions = QuestionModel.objects(tour=tour)
-            answers = []
-            if questions:
-                for question in questions:
-                    answers.extend(AnswerModel.objects(question=question))
-            return answers
+    def resolve_answers_in_tour(cls, _, info, tour_id, first=None, after=None):
+        tour = get_or_none(TourModel, id=tour_id)
+        if tour is not None:
+            # answers do not know their tour, so the ids of the questions in the tour are fetched first.
+            # both queries are served by the (tour, rank) and (question, user) indexes
+            question_ids = QuestionModel.objects(tour=tour).scalar('id')
+            return paginate(project(AnswerModel.objects(question__in=list(question_ids)), info), first, after)
         else:
             return []
 
     @classmethod
     @query_jwt_required
     def resolve_answer(cls, _, info, question_id):
-        if QuestionModel.objects(id=question_id):
-            question = QuestionModel.objects.get(id=question_id)
-            user = UserModel.objects.get(username=get_jwt_identity())
-            return [AnswerModel.objects.get(question=question, user=user)]
-        else:
-            return []
+        question = get_or_none(QuestionModel, id=question_id)
+        if question is not None:
+            answer = get_or_none(AnswerModel, question=question, user=get_current_user())
+            if answer is not None:
+                return [answer]
+        return []
 
     @classmethod
     @query_jwt_required
     def resolve_answers_to_question(cls, _, info, question_id):
-        if QuestionModel.objects(id=question_id):
-            question = QuestionModel.objects.get(id=question_id)
-            user = UserModel.objects.get(username=get_jwt_identity())
-            if question.tour.owner == user:
-                return list(AnswerModel.objects(question=question))
+        question = get_or_none(QuestionModel, id=question_id)
+        if question is not None:
+            user = get_current_user()
+            if get_reference(get_reference(question, 'tour'), 'owner') == user:
+                return list(project(AnswerModel.objects(question=question), info))
         return []
 
     @classmethod
     @query_jwt_required
-    def resolve_answers_by_user(cls, _, info, username, tour_id):
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
-                owner = UserModel.objects.get(username=get_jwt_identity())
-                if tour.owner == owner:
-                    answers = []
-                    for answer in AnswerModel.objects(user=user):
-                        if answer.question.tour == tour:
-                            answers.append(answer)
-                    return answers
+    def resolve_answers_to_question_connection(cls, _, info, question_id, first=None, after=None):
+        question = get_or_none(QuestionModel, id=question_id)
+        if question is not None:
+            user = get_current_user()
+            if get_reference(get_reference(question, 'tour'), 'owner') == user:
+                return connection(AnswerConnection, AnswerModel.objects(question=question), info, first, after)
+        return connection(AnswerConnection, None)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_answers_by_user(cls, _, info, username, tour_id, first=None, after=None):
+        user = get_or_none(UserModel, username=username)
+        if user is not None:
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
+                if get_reference(tour, 'owner') == get_current_user():
+                    # filtered by tour in the database instead of dereferencing the question of every answer
+                    question_ids = QuestionModel.objects(tour=tour).scalar('id')
+                    answers = AnswerModel.objects(question__in=list(question_ids), user=user)
+                    return paginate(project(answers, info), first, after)
         return []
 
     """ given a user name and a tour id returns all answers the user gave to questions in this tour """
@@ -359,25 +423,11 @@ class Query(ObjectType):
     @classmethod
     @query_jwt_required
     def resolve_export_answers(cls, _, info, tour_id, username):
-        if UserModel.objects(username=username):
-            user = UserModel.objects.get(username=username)
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
-                report = 'Antworten für den Nutzer {} im Rundgang {}.\n'.format(user.username, tour.name)
-                questions = QuestionModel.objects(tour=tour)
-                for question in questions:
-                    if AnswerModel.objects(user=user, question=question):
-                        answer = AnswerModel.objects.get(user=user, question=question)
-                        if type(answer) == MCAnswerModel:
-                            text_answers = []
-                            for index in answer.answer:
-                                text_answers.append(question.possible_answers[index])
-                            report = report + 'Frage: {}\n'.format(question.question)
-                            for ta in text_answers:
-                                report = report + 'Antwort: {}'.format(ta) + '\n'
-
-                        else:
-                            report = report + 'Frage: {}\n Antwort: {}\n'.format(question.question, answer.answer)
-
-                return report
+        user = get_or_none(UserModel, username=username)
+        if user is not None:
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
+                # the same report can be downloaded as text, csv or pdf from file/export
+                title = ['Antworten für den Nutzer {} im Rundgang {}.'.format(user.username, tour.name)]
+                return ''.join(text_lines(title, ('Frage', 'Antwort'), user_rows(user, tour)))
         return ""
@@ -0,0 +1,128 @@
+import threading
+import time
+from pymongo import ReturnDocument, UpdateOne
+from models.Badge import Badge as BadgeModel
+from models.User import User as UserModel
+"""
+    Badges and the progress of users towards them.
+    badge_progress of a user is sparse: it only holds the badges the user made progress towards, a missing badge means
+    no progress. Creating a badge therefore does not touch any user. The APIs still return the progress towards every
+    badge, the missing ones are filled in with 0 when the field is resolved.
+    The ids and costs of all badges are read from the catalogue, which is loaded on first use and kept in memory.
+    CreateBadge, UpdateBadge and the upload of badges invalidate it. Other processes, e.g. further workers, reload
+    their copy after CATALOGUE_TTL seconds at the latest.
+    Progress is added with conditional updates on the user document that never read it first, so concurrent progress
+    of the same user is never lost. MongoDB refuses $inc and a $min cap on the same field in one update, so the
+    condition decides between the two: below cost - delta the progress is incremented, otherwise it is set to the cost
+    and the badge is awarded.
+"""
+
+# seconds after which the catalogue is loaded again even if it was not invalidated in this process
+CATALOGUE_TTL = 60
+
+_catalogue = None
+_loaded = 0.0
+_lock = threading.Lock()
+
+
+def catalogue():
+    """ returns a dict mapping the id of every badge to its cost """
+    global _catalogue, _loaded
+    with _lock:
+        if _catalogue is None or time.monotonic() - _loaded > CATALOGUE_TTL:
+            _catalogue = {badge['_id']: badge['cost'] for badge in BadgeModel.objects.only('cost').as_pymongo()}
+            _loaded = time.monotonic()
+        return _catalogue
+
+
+def invalidate_catalogue():
+    """ drops the catalogue so it is loaded again on next use. call after badges are created or changed """
+    global _catalogue
+    with _lock:
+        _catalogue = None
+
+
+def _cost(badge_id):
+    # a badge created in another process may not be in the catalogue yet
+    cost = catalogue().get(badge_id)
+    if cost is None:
+        invalidate_catalogue()
+        cost = catalogue().get(badge_id)
+    return cost
+
+
+def _below(badge_id, value):
+    # filter for progress below value. missing progress counts as 0
+    field = 'badge_progress.' + badge_id
+    if value > 0:
+        return {'$or': [{field: {'$lt': value}}, {field: {'$exists': False}}]}
+    return {field: {'$lt': value}}
+
+
+def _not_below(badge_id, value):
+    field = 'badge_progress.' + badge_id
+    if value > 0:
+        return {field: {'$gte': value}}
+    return {'$or': [{field: {'$gte': value}}, {field: {'$exists': False}}]}
+
+
+def _increment(badge_id, delta):
+    return {'$inc': {'badge_progress.' + badge_id: delta}}
+
+
+def _complete(badge_id, cost):
+    return {'$set': {'badge_progress.' + badge_id: cost}, '$addToSet': {'badges': badge_id}}
+
+
+def add_progress(username, badge_id, delta):
+    """
+        adds delta to the progress of the user towards the badge, capped at the cost of the badge. the badge is
+        awarded when the cost is reached. returns the updated user or None if the user or the badge does not exist.
+        takes one find_one_and_update, or two for the progress that reaches the cost
+    """
+    cost = _cost(badge_id)
+    if cost is None:
+        return None
+    collection = UserModel._get_collection()
+    user = collection.find_one_and_update(dict(_below(badge_id, cost - delta), username=username),
+                                          _increment(badge_id, delta), return_document=ReturnDocument.AFTER)
+    if user is None:
+        # the progress already reaches the cost with delta. it only grows, so this holds for the second update too
+        user = collection.find_one_and_update({'username': username}, _complete(badge_id, cost),
+                                              return_document=ReturnDocument.AFTER)
+    return UserModel._from_son(user) if user is not None else None
+
+
+def add_progress_batch(username, events):
+    """
+        adds the progress of several (badge_id, delta) events in one bulk write. events for the same badge are summed.
+        returns False without changes if the user or one of the badges does not exist
+    """
+    deltas = {}
+    for badge_id, delta in events:
+        deltas[badge_id] = deltas.get(badge_id, 0) + delta
+    costs = {badge_id: _cost(badge_id) for badge_id in deltas}
+    if not deltas or None in costs.values():
+        return False
+    updates = []
+    for badge_id, delta in deltas.items():
+        cost = costs[badge_id]
+        increment = UpdateOne(dict(_below(badge_id, cost - delta), username=username), _increment(badge_id, delta))
+        complete = UpdateOne(dict(_not_below(badge_id, cost - delta), username=username), _complete(badge_id, cost))
+        # only one of the two updates matches. the order makes sure the first does not make the second match:
+        # completing sets the progress to the cost, which is below cost - delta for negative deltas only
+        updates.extend([complete, increment] if delta > 0 else [increment, complete])
+    # one of the two updates of every badge matches the user if it exists
+    return UserModel._get_collection().bulk_write(updates).matched_count > 0
+
+
+def progress(user):
+    """ returns the progress of the user towards every badge, 0 for badges without progress """
+    result = dict.fromkeys(catalogue(), 0)
+    result.update(user.badge_progress or {})
+    return result
+
+
+def resolve_badge_progress(root, info, **kwargs):
+    """ resolver of the badge_progress field of app.Fields.User """
+    return progress(root)
@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from flask import current_app
+"""
+    Bounded cache of pictures on the local disk of the app node.
+    Pictures almost never change, so /file/download serves them from local files instead of reading GridFS chunks.
+    Files are sent with the server's file wrapper, i.e. sendfile where the server supports it.
+    An entry is a picture in one width and format, stored under the type and id of its document together with its
+    ETag, the hash GridFS keeps of the content. Fresh entries are served without asking the database at all. Entries
+    older than BLOB_CACHE_TTL seconds are checked against the ETag of the picture in the database before they are used
+    again, so pictures changed through another node are picked up after at most that long. Changes on this node
+    invalidate the entries of the document right away.
+    When the files exceed BLOB_CACHE_SIZE bytes the least recently used ones are deleted. The cache lives in the file
+    system, so all worker processes of a node share it. Hits and misses are counted per process.
+    Every process keeps a running total of the bytes in the cache and only walks the cache directory when that total
+    exceeds the size or was last counted RECOUNT_AFTER seconds ago. Until then entries written by other processes are
+    not part of the total, so the cache can exceed its size by what they wrote in the meantime.
+"""
+
+# used when the app is not configured. BLOB_CACHE_SIZE 0 disables the cache
+DEFAULT_SIZE = 512 * 1024 * 1024
+DEFAULT_TTL = 300
+# eviction deletes entries until the cache is this much of its size, so not every new entry causes an eviction
+EVICT_TO = 0.9
+# seconds after which the cache directory is walked again to count the entries of other processes
+RECOUNT_AFTER = 60
+
+_stats = {'hits': 0, 'misses': 0, 'revalidations': 0, 'evictions': 0}
+# bytes in the cache as far as this process knows and when they were last counted. None until the first count
+_usage = {'bytes': None, 'counted': 0}
+_lock = threading.Lock()
+
+
+class Entry:
+    """ a cached picture. path is the file holding its bytes """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.etag = meta['etag']
+        self.mimetype = meta['mimetype']
+        self.last_modified = meta['last_modified']
+        self.validated = meta['validated']
+
+
+def _directory():
+    return current_app.config.get('BLOB_CACHE_DIR') or os.path.join(current_app.instance_path, 'blobs')
+
+
+def _size():
+    return current_app.config.get('BLOB_CACHE_SIZE', DEFAULT_SIZE)
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def _account(change):
+    with _lock:
+        if _usage['bytes'] is not None:
+            _usage['bytes'] += change
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _document_directory(type, id):
+    # ids are hashed so they can not leave the cache directory, e.g. a badge id '..'
+    return os.path.join(_directory(), type, hashlib.sha1(str(id).encode('utf-8')).hexdigest())
+
+
+def _path(key):
+    type, id, width, format = key
+    return os.path.join(_document_directory(type, id), '{}.{}'.format(width, format))
+
+
+def _read_meta(path):
+    try:
+        with open(path + '.json') as meta:
+            return json.load(meta)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, write, directory):
+    # written to a temporary file first so other processes never see a partial file
+    handle, temporary = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(handle, 'w' if isinstance(write, str) else 'wb') as target:
+            if isinstance(write, str):
+                target.write(write)
+            else:
+                shutil.copyfileobj(write, target)
+        os.replace(temporary, path)
+    except OSError:
+        os.unlink(temporary)
+        raise
+
+
+def lookup(key):
+    """
+        returns the entry of key, a tuple (type, id, width, format), if it was checked against the database within
+        BLOB_CACHE_TTL seconds. returns None otherwise
+    """
+    if not _size():
+        return None
+    path = _path(key)
+    meta = _read_meta(path)
+    if meta is None or time.time() - meta['validated'] > current_app.config.get('BLOB_CACHE_TTL', DEFAULT_TTL):
+        return None
+    try:
+        # the modification time orders the entries for eviction
+        os.utime(path)
+    except OSError:
+        return None
+    _count('hits')
+    return Entry(path, meta)
+
+
+def store(key, grid_out, mimetype, etag):
+    """
+        returns the entry of key holding grid_out, a GridOut with the given etag. an existing entry with the same etag
+        is reused without reading grid_out. returns None if the cache is disabled or grid_out does not fit
+    """
+    size = _size()
+    if not size or grid_out.length > size * EVICT_TO:
+        _count('misses')
+        return None
+    path = _path(key)
+    meta = _read_meta(path)
+    validated = time.time()
+    try:
+        if meta is not None and meta['etag'] == etag and os.path.exists(path):
+            _count('revalidations')
+            os.utime(path)
+        else:
+            _count('misses')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # an entry with an outdated etag is replaced
+            replaced = _file_size(path)
+            _write(path, grid_out, os.path.dirname(path))
+            _account(grid_out.length - replaced)
+            _evict(size)
+        meta = {'etag': etag, 'mimetype': mimetype, 'validated': validated,
+                'last_modified': grid_out.upload_date.timestamp() if grid_out.upload_date else None}
+        _write(path + '.json', json.dumps(meta), os.path.dirname(path))
+    except OSError:
+        # a full or read-only disk only costs the speed up
+        return None
+    return Entry(path, meta)
+
+
+def _entries():
+    """ yields (modification time, size, path) of every cached file """
+    for directory, _, files in os.walk(_directory()):
+        for name in files:
+            if name.endswith('.json') or name.startswith('tmp'):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            yield status.st_mtime, status.st_size, path
+
+
+def _evict(size):
+    with _lock:
+        known = _usage['bytes']
+        counted = _usage['counted']
+    if known is not None and known <= size and time.time() - counted < RECOUNT_AFTER:
+        return
+    counted = time.time()
+    entries = sorted(_entries())
+    total = sum(entry_size for _, entry_size, _ in entries)
+    if total > size:
+        for _, entry_size, path in entries:
+            if total <= size * EVICT_TO:
+                break
+            for name in (path, path + '.json'):
+                try:
+                    os.unlink(name)
+                except OSError:
+                    pass
+            total -= entry_size
+            _count('evictions')
+    with _lock:
+        _usage['bytes'] = total
+        _usage['counted'] = counted
+
+
+def invalidate(type, id):
+    """ deletes the entries of all versions of the picture of the document. call when the picture changes """
+    directory = _document_directory(type, id)
+    try:
+        with os.scandir(directory) as files:
+            freed = sum(_file_size(file.path) for file in files
+                        if not file.name.endswith('.json') and not file.name.startswith('tmp'))
+    except OSError:
+        return
+    shutil.rmtree(directory, ignore_errors=True)
+    _account(-freed)
+
+
+def stats():
+    """ returns the hits, misses, revalidations and evictions of this process and the number and size of entries """
+    with _lock:
+        result = dict(_stats)
+    entries = list(_entries())
+    result['entries'] = len(entries)
+    result['bytes'] = sum(size for _, size, _ in entries)
+    return result
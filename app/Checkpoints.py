@@ -0,0 +1,201 @@
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from app.Loaders import reference_key
+from models.Checkpoint import Checkpoint as CheckpointModel
+from models.Tour import Tour as TourModel
+"""
+    Order of the checkpoints in a tour.
+    Checkpoints are ordered by a rank instead of a dense index. Ranks start GAP apart, a checkpoint that is moved gets
+    the rank halfway between its new neighbours, so moves and inserts write exactly one document and deletes leave the
+    other checkpoints untouched. The dense 1-based index the APIs expose is computed when reading from the
+    (tour, rank) index: lists number their checkpoints in order, single checkpoints count the checkpoints before them.
+    Equal ranks are ordered by id.
+    Checkpoints are appended by reserving their slots on the tour with one atomic update that raises both the number
+    of checkpoints and last_rank, an upper bound of the ranks in the tour. Concurrent appends therefore always get
+    distinct indices and ranks.
+    When two neighbours get closer than MIN_GAP the ranks of the tour are spread out again by rebalance, which
+    flask checkpoints rebalance also runs for all tours, e.g. to create the ranks of checkpoints that only have the
+    dense index they were stored with before and the last_rank of tours created before it existed.
+"""
+
+# distance between the ranks of neighbouring checkpoints after rebalancing and when appending
+GAP = 1024.0
+# neighbours closer than this are rebalanced before moving a checkpoint between them. far above float precision
+MIN_GAP = 1e-6
+
+# clients are mapped to whether they support transactions. checked once per client as it needs a command
+_transactions = {}
+
+
+def supports_transactions(client):
+    """ returns True if the server the client is connected to supports multi document transactions """
+    if client not in _transactions:
+        try:
+            status = client.admin.command('isMaster')
+        except PyMongoError:
+            status = {}
+        # wire version 7 is MongoDB 4.0 which added transactions on replica sets, 8 is 4.2 for sharded clusters
+        if status.get('msg') == 'isdbgrid':
+            _transactions[client] = status.get('maxWireVersion', 0) >= 8
+        else:
+            _transactions[client] = 'setName' in status and status.get('maxWireVersion', 0) >= 7
+    return _transactions[client]
+
+
+def run_in_transaction(callback):
+    """
+        calls callback with a session that is in a transaction or with None if transactions are not supported.
+        transactions that fail because of a concurrent write are retried by pymongo
+    """
+    client = CheckpointModel._get_db().client
+    if not supports_transactions(client):
+        return callback(None)
+    with client.start_session() as session:
+        return session.with_transaction(callback)
+
+
+def _tour_id(tour):
+    return reference_key(tour) if tour is not None else None
+
+
+def in_order(tour):
+    """ returns the queryset of the checkpoints of the tour in their order """
+    return CheckpointModel.objects(tour=_tour_id(tour)).order_by('rank', 'id')
+
+
+def number(checkpoints, start=1):
+    """ returns the checkpoints as list with their dense index set. checkpoints have to be in order """
+    checkpoints = list(checkpoints)
+    for position, checkpoint in enumerate(checkpoints, start):
+        checkpoint.position = position
+    return checkpoints
+
+
+def position(checkpoint):
+    """ returns the dense 1-based index of the checkpoint in its tour """
+    if getattr(checkpoint, 'position', None) is None:
+        tour_id = reference_key(checkpoint._data.get('tour'))
+        before = CheckpointModel.objects(tour=tour_id)._query
+        before['$or'] = [{'rank': {'$lt': checkpoint.rank}}, {'rank': checkpoint.rank, '_id': {'$lt': checkpoint.pk}}]
+        checkpoint.position = CheckpointModel._get_collection().count_documents(before) + 1
+    return checkpoint.position
+
+
+def resolve_position(root, info, **kwargs):
+    """ resolver of the index field of the checkpoint types in app.Fields """
+    return position(root)
+
+
+def checkpoint_at(tour, index):
+    """ returns the checkpoint at the dense 1-based index in the tour or None if there is none """
+    if index is None or index < 1:
+        return None
+    return in_order(tour).skip(index - 1).first()
+
+
+def reserve_slots(tour, count=1):
+    """
+        reserves count slots at the end of the tour with a single find_one_and_update and returns their
+        (index, rank) pairs in order. returns an empty list if the tour does not exist
+    """
+    tour = TourModel.objects(id=_tour_id(tour)).only('current_checkpoints', 'last_rank').modify(
+        inc__current_checkpoints=count, inc__last_rank=count * GAP, new=True)
+    if tour is None:
+        return []
+    first_index = tour.current_checkpoints - count + 1
+    first_rank = tour.last_rank - (count - 1) * GAP
+    return [(first_index + i, first_rank + i * GAP) for i in range(count)]
+
+
+def append_checkpoints(tour, checkpoints):
+    """
+        appends the new checkpoints to the end of the tour in the given order and saves them. a single checkpoint is
+        saved, several are inserted with one insert_many. returns False if the tour does not exist
+    """
+    slots = reserve_slots(tour, len(checkpoints))
+    if not slots:
+        return False
+    for checkpoint, (index, rank) in zip(checkpoints, slots):
+        checkpoint.rank = rank
+        checkpoint.position = index
+    if len(checkpoints) == 1:
+        checkpoints[0].save()
+    else:
+        CheckpointModel.objects.insert(checkpoints, load_bulk=False)
+    return True
+
+
+def _last_rank(tour_id):
+    # rank behind every checkpoint of the tour, including those appended concurrently
+    tour = TourModel.objects(id=tour_id).only('last_rank').modify(inc__last_rank=GAP, new=True)
+    return tour.last_rank if tour is not None else None
+
+
+def rebalance(tour):
+    """
+        spreads the ranks of the checkpoints in the tour GAP apart keeping their order. checkpoints without a rank are
+        ordered by the index they were stored with before ranks existed, which is removed.
+        the last_rank of the tour is raised to the last of the new ranks if it is lower
+    """
+    tour_id = _tour_id(tour)
+    collection = CheckpointModel._get_collection()
+    tours = TourModel._get_collection()
+
+    def spread(session):
+        checkpoints = collection.find({'tour': tour_id}, {'_id': 1}, session=session).sort(
+            [('rank', 1), ('index', 1), ('_id', 1)])
+        updates = [UpdateOne({'_id': checkpoint['_id']}, {'$set': {'rank': GAP * position}, '$unset': {'index': ''}})
+                   for position, checkpoint in enumerate(checkpoints, 1)]
+        if updates:
+            collection.bulk_write(updates, session=session)
+            tours.update_one({'_id': tour_id}, {'$max': {'last_rank': GAP * len(updates)}}, session=session)
+
+    run_in_transaction(spread)
+
+
+def move_checkpoint(checkpoint, index):
+    """
+        moves the checkpoint to the dense index. -1 or an index greater than the number of checkpoints in the tour
+        moves it to the end. only the rank of the moved checkpoint changes, unless its new neighbours are too close
+    """
+    tour_id = reference_key(checkpoint._data['tour'])
+    others = in_order(tour_id)(id__ne=checkpoint.pk)
+    for attempt in range(2):
+        count = CheckpointModel._get_collection().count_documents(others._query)
+        target = count + 1 if index == -1 or index > count else max(index, 1)
+        # ranks of the checkpoints that will be before and after the moved one
+        if target == 1:
+            ranks = [None] + list(others.limit(1).scalar('rank'))
+        else:
+            ranks = list(others.skip(target - 2).limit(2).scalar('rank'))
+        before = ranks[0]
+        after = ranks[1] if len(ranks) > 1 else None
+        if before is None and after is None:
+            rank = GAP
+        elif before is None:
+            rank = after - GAP
+        elif after is None:
+            rank = _last_rank(tour_id)
+            if rank is None:
+                return
+        elif after - before >= MIN_GAP or attempt:
+            rank = (before + after) / 2
+        else:
+            rebalance(tour_id)
+            continue
+        checkpoint.update(set__rank=rank)
+        checkpoint.position = None
+        return
+
+
+def delete_checkpoint(checkpoint):
+    """
+        deletes the checkpoint together with the answers to it and reduces the number of checkpoints of the tour. the
+        ranks of the other checkpoints stay as they are. does nothing if the checkpoint was already deleted
+    """
+    tour_id = reference_key(checkpoint._data['tour'])
+    # delete rules are registered on the class they reference, e.g. answers on Question, so the queryset has to be
+    # the one of the checkpoint's own class for them to apply. only the request that actually deleted the checkpoint
+    # adjusts the tour
+    if type(checkpoint).objects(id=checkpoint.pk).delete():
+        TourModel.objects(id=tour_id).update_one(dec__current_checkpoints=1)
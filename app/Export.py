@@ -0,0 +1,184 @@
+import csv
+import io
+import textwrap
+from models.Answer import Answer as AnswerModel
+from models.Checkpoint import Checkpoint as CheckpointModel
+from models.Question import Question as QuestionModel
+from models.User import User as UserModel
+"""
+    Export of answers as text, csv or pdf.
+    Reports are produced as generators so they can be written to a streamed response while the answers are still read
+    from the database: memory use does not depend on the number of answers and the first bytes are sent right away.
+    A report is made of title lines, column names and rows. Rows hold one value per column.
+    Answers and questions both live in the tour database and are read with a single $lookup aggregation. Users are in
+    a different database and are loaded in batches of BATCH_SIZE answers.
+"""
+
+# number of documents fetched from the database at once and number of answers whose users are loaded with one query
+BATCH_SIZE = 200
+# mimetype and file extension of the supported formats
+FORMATS = {'text': ('text/plain; charset=utf-8', 'txt'),
+           'csv': ('text/csv; charset=utf-8', 'csv'),
+           'pdf': ('application/pdf', 'pdf')}
+
+
+def answer_text(answer, question):
+    """ returns an answer as text. multiple choice answers are stored as indices into the possible answers """
+    if isinstance(answer, list):
+        choices = question.get('possible_answers', [])
+        return ', '.join(choices[index] if 0 <= index < len(choices) else str(index) for index in answer)
+    if answer is None:
+        return ''
+    return str(answer)
+
+
+def _answers_with_questions(match, sort=None):
+    """ returns a cursor over the raw answers matching match, each with its raw question joined in as question """
+    pipeline = [{'$match': match},
+                {'$lookup': {'from': CheckpointModel._get_collection_name(),
+                             'localField': 'question',
+                             'foreignField': '_id',
+                             'as': 'question'}},
+                {'$unwind': '$question'}]
+    if sort is not None:
+        pipeline.append({'$sort': sort})
+    return AnswerModel.objects.aggregate(*pipeline, batchSize=BATCH_SIZE)
+
+
+def question_rows(question):
+    """ yields (username, answer) for every answer given to the question """
+    raw_question = question.to_mongo()
+    batch = []
+    for answer in AnswerModel.objects(question=question).as_pymongo().batch_size(BATCH_SIZE):
+        batch.append(answer)
+        if len(batch) == BATCH_SIZE:
+            yield from _with_usernames(batch, raw_question)
+            batch = []
+    yield from _with_usernames(batch, raw_question)
+
+
+def _with_usernames(answers, question):
+    if not answers:
+        return
+    users = UserModel.objects(id__in=[answer['user'] for answer in answers]).only('username').as_pymongo()
+    usernames = {user['_id']: user['username'] for user in users}
+    for answer in answers:
+        yield usernames.get(answer['user'], ''), answer_text(answer.get('answer'), question)
+
+
+def user_rows(user, tour=None):
+    """ yields (question, answer) for every answer of the user, restricted to the questions of tour if given """
+    match = {'user': user.pk}
+    sort = None
+    if tour is not None:
+        match['question'] = {'$in': list(QuestionModel.objects(tour=tour).scalar('id'))}
+        sort = {'question.rank': 1, 'question._id': 1}
+    for answer in _answers_with_questions(match, sort):
+        question = answer['question']
+        yield question.get('question', ''), answer_text(answer.get('answer'), question)
+
+
+def text_lines(title, columns, rows):
+    """ yields the report as lines of text, each row as one 'column: value' line per column """
+    for line in title:
+        yield line + '\n'
+    for row in rows:
+        yield ''.join('{}: {}\n'.format(column, value) for column, value in zip(columns, row))
+
+
+def render(title, columns, rows, format):
+    """ yields the report as bytes in one of FORMATS """
+    if format == 'csv':
+        return _render_csv(columns, rows)
+    if format == 'pdf':
+        return PdfWriter().write(text_lines(title, columns, rows))
+    return (line.encode('utf-8') for line in text_lines(title, columns, rows))
+
+
+def _render_csv(columns, rows):
+    # the buffer only ever holds a single row
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def _pdf_string(text):
+    # WinAnsiEncoding of the standard fonts matches cp1252, which covers the german umlauts
+    text = text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+    return b'(' + text.encode('cp1252', errors='replace') + b')'
+
+
+class PdfWriter:
+    """
+        Writes text as an A4 pdf in Helvetica. Every page is written as soon as it is full, only the byte offsets of
+        the objects are kept until the cross reference table at the end of the file.
+    """
+    WIDTH = 595
+    HEIGHT = 842
+    MARGIN = 50
+    FONT_SIZE = 10
+    LEADING = 14
+    LINES_PER_PAGE = (HEIGHT - 2 * MARGIN) // LEADING
+    # characters per line. roughly what fits between the margins for average Helvetica text
+    CHARACTERS_PER_LINE = 95
+    # 1 is the catalog, 2 the page tree and 3 the font. pages start at 4
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self):
+        self.position = 0
+        self.offsets = {}
+        self.pages = []
+        self.next_object = 4
+
+    def _write(self, data):
+        self.position += len(data)
+        return data
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        return self._write(b'%d 0 obj\n' % number + body + b'\nendobj\n')
+
+    def _page(self, lines):
+        stream = [b'BT', b'/F1 %d Tf' % self.FONT_SIZE, b'%d TL' % self.LEADING,
+                  b'%d %d Td' % (self.MARGIN, self.HEIGHT - self.MARGIN)]
+        stream.extend(_pdf_string(line) + b' Tj T*' for line in lines)
+        stream.append(b'ET')
+        stream = b'\n'.join(stream)
+        contents, page = self.next_object, self.next_object + 1
+        self.next_object += 2
+        self.pages.append(page)
+        yield self._object(contents, b'<< /Length %d >>\nstream\n' % len(stream) + stream + b'\nendstream')
+        yield self._object(page, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R '
+                                 b'/Resources << /Font << /F1 %d 0 R >> >> >>'
+                           % (self.PAGES, self.WIDTH, self.HEIGHT, contents, self.FONT))
+
+    def write(self, text):
+        """ yields the pdf for text, an iterable of strings that may contain line breaks """
+        yield self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        yield self._object(self.FONT, b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                                      b'/Encoding /WinAnsiEncoding >>')
+        lines = []
+        for chunk in text:
+            for line in chunk.rstrip('\n').split('\n'):
+                for part in textwrap.wrap(line, self.CHARACTERS_PER_LINE) or ['']:
+                    lines.append(part)
+                    if len(lines) == self.LINES_PER_PAGE:
+                        yield from self._page(lines)
+                        lines = []
+        if lines or not self.pages:
+            yield from self._page(lines)
+        kids = b' '.join(b'%d 0 R' % page for page in self.pages)
+        yield self._object(self.PAGES, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(self.pages)))
+        yield self._object(self.CATALOG, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGES)
+        xref = self.position
+        entries = [b'0000000000 65535 f \n']
+        entries.extend(b'%010d 00000 n \n' % self.offsets[number] for number in range(1, self.next_object))
+        yield b'xref\n0 %d\n' % self.next_object + b''.join(entries)
+        yield b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (self.next_object, self.CATALOG,
+                                                                                    xref)
@@ -0,0 +1,33 @@
+from app.Fields import ObjectFacets, FacetCount
+from models.MuseumObject import MuseumObject as MuseumObjectModel
+"""
+    Counts of museum objects per value of the fields the catalogue is browsed by.
+    All fields are counted with one $facet aggregation, so browse screens get their numbers without loading objects.
+"""
+
+# fields objects are counted by
+FACET_FIELDS = ('category', 'sub_category', 'art_type', 'material', 'creator')
+
+
+def facets(queryset):
+    """
+        returns a dict mapping every field of FACET_FIELDS to (value, count) pairs of the objects in queryset, most
+        frequent values first. objects without a value for a field are not counted for it
+    """
+    pipeline = [{'$match': queryset._query},
+                {'$facet': {field: [{'$match': {_db_field(field): {'$nin': [None, '']}}},
+                                    {'$group': {'_id': '$' + _db_field(field), 'count': {'$sum': 1}}},
+                                    {'$sort': {'count': -1, '_id': 1}}]
+                            for field in FACET_FIELDS}}]
+    result = next(MuseumObjectModel.objects.aggregate(*pipeline), {})
+    return {field: [(group['_id'], group['count']) for group in result.get(field, [])] for field in FACET_FIELDS}
+
+
+def object_facets(queryset):
+    """ returns the facets of the objects in queryset as ObjectFacets for the objectFacets queries """
+    return ObjectFacets(**{field: [FacetCount(value=value, count=count) for value, count in counts]
+                           for field, counts in facets(queryset).items()})
+
+
+def _db_field(field):
+    return MuseumObjectModel._fields[field].db_field
@@ -1,5 +1,9 @@
 from graphene_mongo import MongoengineObjectType
-from graphene import Union
+from graphene import ObjectType, Union, Int, Float, String, Field, List
+from graphene.relay import Connection
+from app.Loaders import load_reference
+from app.Checkpoints import resolve_position
+from app.Badges import resolve_badge_progress
 from models.MuseumObject import MuseumObject as MuseumObjectModel
 from models.Question import Question as QuestionModel
 from models.Answer import Answer as AnswerModel
@@ -21,6 +25,8 @@ from models.ProfilePicture import ProfilePicture as ProfilePictureModel
 """
     This file contains the models used in GraphQL. 
     A model for a type is only needed when it is returned by a GraphQL function.  
+    Reference fields are resolved through the batching loaders in app.Loaders.
+    Connections are the return types of the paginated *_connection queries, pages are created by app.Pagination.
 """
 
 
@@ -28,36 +34,63 @@ class Tour(MongoengineObjectType):
     class Meta:
         model = TourModel
 
+    resolve_owner = load_reference('owner')
+    resolve_users = load_reference('users')
+
 
 class Question(MongoengineObjectType):
     class Meta:
         model = QuestionModel
 
+    # dense 1-based position in the tour, computed from the rank when reading
+    index = Int()
+    resolve_index = resolve_position
+    resolve_tour = load_reference('tour')
+    resolve_linked_objects = load_reference('linked_objects')
+
 
 class MCQuestion(MongoengineObjectType):
     class Meta:
         model = MCQuestionModel
 
+    # dense 1-based position in the tour, computed from the rank when reading
+    index = Int()
+    resolve_index = resolve_position
+    resolve_tour = load_reference('tour')
+    resolve_linked_objects = load_reference('linked_objects')
+
 
 class Answer(MongoengineObjectType):
     class Meta:
         model = AnswerModel
 
+    resolve_question = load_reference('question')
+    resolve_user = load_reference('user')
+
 
 class MCAnswer(MongoengineObjectType):
     class Meta:
         model = MCAnswerModel
 
+    resolve_question = load_reference('question')
+    resolve_user = load_reference('user')
+
 
 class MuseumObject(MongoengineObjectType):
     class Meta:
         model = MuseumObjectModel
 
+    resolve_picture = load_reference('picture')
+
 
 class User(MongoengineObjectType):
     class Meta:
         model = UserModel
 
+    resolve_badges = load_reference('badges')
+    resolve_profile_picture = load_reference('profile_picture')
+    resolve_badge_progress = resolve_badge_progress
+
 
 class Admin(MongoengineObjectType):
     class Meta:
@@ -78,11 +111,17 @@ class TourFeedback(MongoengineObjectType):
     class Meta:
         model = TourFeedbackModel
 
+    resolve_tour = load_reference('tour')
+
 
 class Favourites(MongoengineObjectType):
     class Meta:
         model = FavouritesModel
 
+    resolve_user = load_reference('user')
+    resolve_favourite_tours = load_reference('favourite_tours')
+    resolve_favourite_objects = load_reference('favourite_objects')
+
 
 class Picture(MongoengineObjectType):
     class Meta:
@@ -103,16 +142,33 @@ class Checkpoint(MongoengineObjectType):
     class Meta:
         model = CheckpointModel
 
+    # dense 1-based position in the tour, computed from the rank when reading
+    index = Int()
+    resolve_index = resolve_position
+    resolve_tour = load_reference('tour')
+
 
 class PictureCheckpoint(MongoengineObjectType):
     class Meta:
         model = PictureCheckpointModel
 
+    # dense 1-based position in the tour, computed from the rank when reading
+    index = Int()
+    resolve_index = resolve_position
+    resolve_tour = load_reference('tour')
+    resolve_picture = load_reference('picture')
+
 
 class ObjectCheckpoint(MongoengineObjectType):
     class Meta:
         model = ObjectCheckpointModel
 
+    # dense 1-based position in the tour, computed from the rank when reading
+    index = Int()
+    resolve_index = resolve_position
+    resolve_tour = load_reference('tour')
+    resolve_museum_object = load_reference('museum_object')
+
 
 class CheckpointUnion(Union):
     """
@@ -162,3 +218,80 @@ class AnswerUnion(Union):
             return MCAnswer
         elif isinstance(instance, Answer):
             return Answer
+
+
+class CountableConnection(Connection):
+    """
+        Relay connection with the total number of documents matching the query. The count is an extra query and only
+        run if totalCount is requested.
+    """
+    class Meta:
+        abstract = True
+
+    total_count = Int()
+
+    def resolve_total_count(self, info):
+        return self.count()
+
+
+class TourConnection(CountableConnection):
+    class Meta:
+        node = Tour
+
+
+class MuseumObjectConnection(CountableConnection):
+    class Meta:
+        node = MuseumObject
+
+
+class TourFeedbackConnection(CountableConnection):
+    class Meta:
+        node = TourFeedback
+
+
+class AppFeedbackConnection(CountableConnection):
+    class Meta:
+        node = AppFeedback
+
+
+class CodeConnection(CountableConnection):
+    class Meta:
+        node = Code
+
+
+class AnswerConnection(CountableConnection):
+    class Meta:
+        node = AnswerUnion
+
+
+class Highlight(ObjectType):
+    """ part of a field of a search result around the words that matched. html escaped, matches are in <em> """
+    field = String()
+    snippet = String()
+
+
+class SearchHit(ObjectType):
+    """ an object found by searchObjects with its relevance and the parts of it that matched, see app.Search """
+    museum_object = Field(MuseumObject)
+    score = Float()
+    highlights = List(Highlight)
+
+
+class MuseumObjectSearchConnection(CountableConnection):
+    class Meta:
+        node = SearchHit
+
+
+class FacetCount(ObjectType):
+    """ number of objects with a value """
+    value = String()
+    count = Int()
+
+
+class ObjectFacets(ObjectType):
+    """ numbers of objects per value of the fields objects are browsed by, most frequent values first """
+    category = List(FacetCount)
+    sub_category = List(FacetCount)
+    art_type = List(FacetCount)
+    material = List(FacetCount)
+    creator = List(FacetCount)
@@ -0,0 +1,89 @@
+import io
+from flask import current_app
+from mongoengine import NotUniqueError
+from PIL import Image, ImageOps
+from models.Derivative import Derivative as DerivativeModel
+"""
+    Scaled and converted versions of pictures.
+    Clients ask for a width and a format instead of the original upload, e.g. a 320 pixel wide WebP for a list
+    thumbnail. Widths are rounded up to one of the configured IMAGE_WIDTHS so every picture only ever has a few
+    versions, pictures are never scaled up. Versions are made with Pillow the first time they are requested and stored
+    in GridFS as Derivative, which covers pictures from every upload path and the ingestion scripts alike.
+    Versions belong to the GridFS file they were made from and are deleted when it is replaced or deleted.
+"""
+
+# mimetypes of the formats versions can be made in
+MIMETYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'png': 'image/png'}
+# used when the app is not configured
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+DEFAULT_QUALITY = 80
+
+
+def choose_width(width):
+    """ returns the smallest configured width not below width, or the largest configured one """
+    widths = sorted(current_app.config.get('IMAGE_WIDTHS', DEFAULT_WIDTHS))
+    for candidate in widths:
+        if candidate >= width:
+            return candidate
+    return widths[-1]
+
+
+def negotiate(format, accept, original):
+    """
+        returns the format to send a picture stored as original in. an explicit format wins, otherwise webp is sent to
+        clients that accept it. returns None for unknown formats
+    """
+    if format is not None:
+        format = 'jpeg' if format == 'jpg' else format
+        return format if format in MIMETYPES else None
+    if accept is not None and 'image/webp' in accept:
+        return 'webp'
+    return original
+
+
+def version(picture, width, format, original):
+    """
+        returns the FileField value to send for picture, the FileField value of an original stored in format original,
+        at width (None for the original width) in format. creates the version if it does not exist yet
+    """
+    if picture.grid_id is None or width is None and format == original:
+        return picture
+    width = choose_width(width) if width is not None else 0
+    derivative = DerivativeModel.objects(source=picture.grid_id, width=width, format=format).first()
+    if derivative is None:
+        derivative = DerivativeModel(source=picture.grid_id, width=width, format=format)
+        derivative.picture.put(_render(picture, width, format), content_type=MIMETYPES[format])
+        try:
+            derivative.save()
+        except NotUniqueError:
+            # made by a concurrent request in the meantime
+            derivative.picture.delete()
+            derivative = DerivativeModel.objects.get(source=picture.grid_id, width=width, format=format)
+    return derivative.picture
+
+
+def _render(picture, width, format):
+    image = Image.open(picture.get())
+    # photos taken upright are often stored sideways with the rotation in their exif data
+    image = ImageOps.exif_transpose(image)
+    if 0 < width < image.width:
+        image = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+    if format == 'jpeg' and image.mode != 'RGB':
+        # jpeg has no transparency, transparent parts of badges become white
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[3])
+        image = background
+    elif format == 'webp' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = io.BytesIO()
+    image.save(buffer, format.upper(), quality=current_app.config.get('IMAGE_QUALITY', DEFAULT_QUALITY))
+    buffer.seek(0)
+    return buffer
+
+
+def delete_versions(picture):
+    """ deletes all versions of the FileField value picture. call before replacing or deleting the picture """
+    if picture is not None and picture.grid_id is not None:
+        for derivative in DerivativeModel.objects(source=picture.grid_id):
+            derivative.delete()
@@ -0,0 +1,155 @@
+from bson import DBRef
+from flask import g, has_app_context
+from flask_graphql_auth import get_jwt_identity
+from mongoengine import Document, ListField, ValidationError
+from promise import Promise
+from promise.dataloader import DataLoader
+from models.User import User as UserModel
+"""
+    Request scoped document access.
+    get_or_none and get_current_user form an identity map: a document is loaded at most once per request no matter how
+    many resolvers and mutations ask for it. Use them instead of checking Model.objects(...) and then calling
+    Model.objects.get(...) which costs two queries for the same document.
+
+    Batching loaders for ReferenceFields.
+    Without these every reference on a returned document is dereferenced on its own, e.g. 300 answers to a question
+    cause 300 queries for the users that wrote them. Resolvers created by load_reference instead hand the referenced id
+    to a DataLoader that collects all ids requested while the current level of the query is resolved and fetches them
+    with a single $in query per collection.
+
+    Both live in flask.g so the documents they cached only exist for the duration of one request.
+"""
+
+
+class DocumentLoader(DataLoader):
+    """ Loads documents of a single model by primary key. Unknown keys resolve to None. """
+
+    def __init__(self, model):
+        super(DocumentLoader, self).__init__()
+        self.model = model
+
+    def batch_load_fn(self, keys):
+        documents = self.model.objects.in_bulk(keys)
+        return Promise.resolve([documents.get(key) for key in keys])
+
+
+def get_loader(model):
+    """ returns the loader for the model that belongs to the current request """
+    # outside of a request e.g. in scripts there is nothing to share the loader with
+    if not has_app_context():
+        return DocumentLoader(model)
+    loaders = g.setdefault('document_loaders', {})
+    if model not in loaders:
+        loaders[model] = DocumentLoader(model)
+    return loaders[model]
+
+
+def reference_key(value):
+    """ returns the primary key of a raw reference value without dereferencing it """
+    if isinstance(value, DBRef):
+        return value.id
+    if isinstance(value, Document):
+        return value.pk
+    return value
+
+
+def _load(model, value):
+    # documents that were already dereferenced, e.g. after being assigned in a mutation, need no query
+    if isinstance(value, Document):
+        return value
+    return get_loader(model).load(reference_key(value))
+
+
+def load_reference(field_name):
+    """
+        Creates a resolver for a ReferenceField or a ListField of ReferenceFields that loads the referenced documents
+        through the batching loaders. Used as resolve_<field_name> = load_reference('<field_name>') in app.Fields
+    """
+    def resolver(root, info, **kwargs):
+        field = root._fields[field_name]
+        # reading _data instead of the attribute skips mongoengine's own one-by-one dereferencing
+        value = root._data.get(field_name)
+        if isinstance(field, ListField):
+            if not value:
+                return []
+            model = field.field.document_type
+            # references to documents that have since been deleted are dropped
+            return Promise.all([_load(model, item) for item in value]).then(
+                lambda documents: [document for document in documents if document is not None])
+        if value is None:
+            return None
+        return _load(field.document_type, value)
+    return resolver
+
+
+def _pk_filter(model, filters):
+    # lookups by primary key share their entry in the identity map no matter how the key was spelled
+    if len(filters) != 1:
+        return None
+    name, value = next(iter(filters.items()))
+    id_field = model._meta['id_field']
+    if name not in ('id', 'pk', id_field):
+        return None
+    try:
+        return model._fields[id_field].to_python(value)
+    except ValidationError:
+        return value
+
+
+def get_or_none(model, **filters):
+    """
+        returns the first document of model matching the filters or None if there is none.
+        within a request every lookup is only sent to the database once, the document is also handed to the
+        batching loader of the model so references to it are not loaded again either.
+        misses are not remembered as the document may be created later in the same request.
+    """
+    pk = _pk_filter(model, filters)
+    if pk is not None:
+        key = (model, 'pk', pk)
+    else:
+        key = (model, tuple(sorted(filters.items())))
+    identity_map = g.setdefault('identity_map', {}) if has_app_context() else {}
+    if key in identity_map:
+        return identity_map[key]
+    try:
+        document = model.objects(**filters).first()
+    # malformed ids can not match any document
+    except ValidationError:
+        return None
+    if document is not None:
+        identity_map[key] = document
+        identity_map[(model, 'pk', document.pk)] = document
+        get_loader(model).prime(document.pk, document)
+    return document
+
+
+def forget(document):
+    """ removes a deleted document from the identity map and the loaders of the current request """
+    if not has_app_context():
+        return
+    # a document may have been loaded through any of its parent classes, e.g. a Question as Checkpoint
+    models = [model for model in type(document).__mro__ if isinstance(model, type) and issubclass(model, Document)]
+    pk_keys = {(model, 'pk', document.pk) for model in models}
+    identity_map = g.get('identity_map', {})
+    for key in [key for key, value in identity_map.items() if value is document or key in pk_keys]:
+        del identity_map[key]
+    loaders = g.get('document_loaders', {})
+    for model in models:
+        if model in loaders:
+            loaders[model].clear(document.pk)
+
+
+def get_reference(document, field_name):
+    """
+        returns the document referenced by a ReferenceField through the identity map. unlike accessing the attribute
+        this does not query the database if the referenced document was already loaded in this request
+    """
+    value = document._data.get(field_name)
+    if value is None or isinstance(value, Document):
+        return value
+    return get_or_none(document._fields[field_name].document_type, pk=reference_key(value))
+
+
+def get_current_user():
+    """ returns the User the jwt of the current request belongs to or None if the account does not exist """
+    return get_or_none(UserModel, username=get_jwt_identity())
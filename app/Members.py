@@ -0,0 +1,26 @@
+from app.Loaders import reference_key
+from models.Tour import Tour as TourModel
+"""
+    Membership of users in tours.
+    The members of a tour are stored as the ids of the users in Tour.users. Checking `user in tour.users` dereferences
+    every member, which for a featured tour means loading thousands of users to accept a single answer. Members are
+    therefore only ever checked, added and removed through the ('users', 'id') index of Tour by user id.
+"""
+
+
+def is_member(tour, user):
+    """ returns True if the user is a member of the tour. tour may also be its id. neither is dereferenced """
+    if tour is None or user is None:
+        return False
+    query = {'_id': reference_key(tour), 'users': reference_key(user)}
+    return TourModel._get_collection().find_one(query, {'_id': 1}) is not None
+
+
+def add_member(tour, user):
+    """ adds the user to the members of the tour unless they are one already. returns the updated tour """
+    return TourModel.objects(id=reference_key(tour)).modify(new=True, add_to_set__users=reference_key(user))
+
+
+def remove_member(tour, user):
+    """ removes the user from the members of the tour if they are one. returns the updated tour """
+    return TourModel.objects(id=reference_key(tour)).modify(new=True, pull__users=reference_key(user))
@@ -0,0 +1,128 @@
+import base64
+import binascii
+from graphene.relay import PageInfo
+from mongoengine import ValidationError
+from app.Projection import project
+"""
+    Pagination for list queries.
+    Pages are cut by primary key instead of skip so that later pages cost the same as the first one: the client passes
+    the id or cursor of the last document it received as after and gets the next first documents. The range on the
+    primary key is served by the _id index or by indexes that end in it like ('status', 'id') on Tour.
+    paginate returns a plain list for the List queries, connection a relay style connection with cursors and an
+    optional totalCount for the *_connection queries.
+    Results ordered by something else than the primary key, e.g. search results ordered by relevance, are paged by
+    position with ranked_connection instead.
+"""
+
+# upper limit for the size of a page of a connection. also used when first is not given
+MAX_PAGE_SIZE = 100
+
+
+def paginate(queryset, first=None, after=None):
+    """
+        returns the documents of the queryset ordered by primary key that come after the document with the id after.
+        at most first documents are returned. without first and after all documents are returned.
+        an invalid after id returns an empty list
+    """
+    if first is not None and first <= 0:
+        return []
+    queryset = queryset.order_by('pk')
+    if after is not None:
+        queryset = queryset(pk__gt=after)
+    if first is not None:
+        queryset = queryset.limit(first)
+    try:
+        return list(queryset)
+    except ValidationError:
+        return []
+
+
+def encode_cursor(pk):
+    """ returns the opaque cursor of the document with the primary key pk """
+    return base64.urlsafe_b64encode(str(pk).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(model, cursor):
+    """ returns the primary key the cursor was created from or None if the cursor is malformed """
+    try:
+        value = base64.b64decode(cursor.encode('ascii'), altchars=b'-_', validate=True).decode('utf-8')
+    except (binascii.Error, UnicodeError):
+        return None
+    return model._fields[model._meta['id_field']].to_python(value)
+
+
+def connection(connection_type, queryset, info=None, first=None, after=None):
+    """
+        returns a page of the queryset as connection_type, a subclass of app.Fields.CountableConnection.
+        passing None as queryset returns an empty connection, e.g. if the user may not see the documents.
+        with info only the fields selected for the nodes are loaded, see app.Projection.
+        totalCount is only counted if the client asks for it
+    """
+    if queryset is None:
+        return _connection(connection_type, [], False, after is not None, lambda: 0)
+    # the count ignores the page, so it is taken from the queryset before the range on the primary key is applied
+    total_count = _counter(queryset)
+    if first is None or first > MAX_PAGE_SIZE:
+        first = MAX_PAGE_SIZE
+    if first <= 0:
+        return _connection(connection_type, [], False, after is not None, total_count)
+    if info is not None:
+        queryset = project(queryset, info, ('edges', 'node'))
+    queryset = queryset.order_by('pk')
+    if after is not None:
+        pk = decode_cursor(queryset._document, after)
+        if pk is None:
+            return _connection(connection_type, [], False, True, total_count)
+        queryset = queryset(pk__gt=pk)
+    try:
+        # one more document than requested tells if there is a next page
+        documents = list(queryset.limit(first + 1))
+    except ValidationError:
+        return _connection(connection_type, [], False, True, total_count)
+    edges = [(document, encode_cursor(document.pk)) for document in documents[:first]]
+    return _connection(connection_type, edges, len(documents) > first, after is not None, total_count)
+
+
+def ranked_connection(connection_type, queryset, first=None, after=None, node=None):
+    """
+        returns a page of the queryset in its own order as connection_type. cursors hold the position in the results,
+        so pages are cut with skip and may shift if documents are added or removed between two requests.
+        node turns a document into the node of its edge, by default the document is the node
+    """
+    if queryset is None:
+        return _connection(connection_type, [], False, after is not None, lambda: 0)
+    total_count = _counter(queryset)
+    if first is None or first > MAX_PAGE_SIZE:
+        first = MAX_PAGE_SIZE
+    start = 0
+    if after is not None:
+        try:
+            start = int(base64.b64decode(after.encode('ascii'), altchars=b'-_', validate=True).decode('ascii')) + 1
+        except (binascii.Error, UnicodeError, ValueError):
+            start = 0
+        # positions start at 0, so the document after the first one is at 1
+        if start < 1:
+            return _connection(connection_type, [], False, True, total_count)
+    if first <= 0:
+        return _connection(connection_type, [], False, after is not None, total_count)
+    documents = list(queryset.skip(start).limit(first + 1))
+    edges = [(node(document) if node is not None else document, encode_cursor(position))
+             for position, document in enumerate(documents[:first], start)]
+    return _connection(connection_type, edges, len(documents) > first, after is not None, total_count)
+
+
+def _counter(queryset):
+    query = queryset._query
+    collection = queryset._collection
+    return lambda: collection.count_documents(query)
+
+
+def _connection(connection_type, edges, has_next_page, has_previous_page, total_count):
+    edges = [connection_type.Edge(node=node, cursor=cursor) for node, cursor in edges]
+    page_info = PageInfo(start_cursor=edges[0].cursor if edges else None,
+                         end_cursor=edges[-1].cursor if edges else None,
+                         has_next_page=has_next_page,
+                         has_previous_page=has_previous_page)
+    result = connection_type(edges=edges, page_info=page_info)
+    result.count = total_count
+    return result
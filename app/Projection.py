@@ -0,0 +1,63 @@
+from graphene.utils.str_converters import to_snake_case
+from graphql.language import ast
+from mongoengine.base import get_document
+"""
+    Projection of list queries onto the fields the client selected.
+    project restricts a queryset with only() to the fields in the selection set of the query, so long texts like the
+    description of a MuseumObject are neither sent by MongoDB nor turned into python objects when the client only
+    asks for objectId and title.
+"""
+
+
+def _selections(selection_set, fragments):
+    """ yields the fields of a selection set, resolving fragments and inline fragments """
+    for selection in selection_set.selections:
+        if isinstance(selection, ast.Field):
+            yield selection
+        elif isinstance(selection, ast.FragmentSpread):
+            yield from _selections(fragments[selection.name.value].selection_set, fragments)
+        elif isinstance(selection, ast.InlineFragment):
+            yield from _selections(selection.selection_set, fragments)
+
+
+def selected_fields(info, path=()):
+    """
+        returns the names of the fields selected below the field that is resolved. path leads through nested fields
+        to the documents, e.g. ('edges', 'node') for connections. names are returned as written in the query
+    """
+    fields = list(info.field_asts)
+    for name in path:
+        fields = [child for field in fields if field.selection_set
+                  for child in _selections(field.selection_set, info.fragments) if child.name.value == name]
+    names = set()
+    for field in fields:
+        if field.selection_set:
+            names.update(child.name.value for child in _selections(field.selection_set, info.fragments))
+    return names
+
+
+def _document_fields(model):
+    # subclasses share the collection, e.g. Question fields may be selected on a Checkpoint queryset
+    fields = set(model._fields)
+    for name in model._subclasses:
+        fields.update(get_document(name)._fields)
+    return fields
+
+
+def project(queryset, info, path=()):
+    """
+        returns the queryset restricted to the fields selected in the query.
+        if a selected field is not a field of the document, e.g. one computed by a resolver, all fields are loaded
+    """
+    document_fields = _document_fields(queryset._document)
+    fields = set()
+    for name in selected_fields(info, path):
+        if name == '__typename':
+            continue
+        field = to_snake_case(name)
+        if field not in document_fields:
+            return queryset
+        fields.add(field)
+    if not fields:
+        return queryset
+    return queryset.only(*fields)
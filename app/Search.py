@@ -0,0 +1,106 @@
+import html
+import re
+from app.Fields import MuseumObjectSearchConnection, SearchHit, Highlight
+from app.Pagination import ranked_connection
+"""
+    Full text search over the museum objects.
+    Objects are found through the text index on MuseumObject, which MongoDB builds with its german stemmer and which
+    ignores diacritics, so 'Schussel' also finds 'Schüssel'. Queries spelling umlauts as ae, oe and ue are expanded
+    with the umlaut spelling as the index cannot know that 'Schuessel' is the same word. Only pairs that can spell an
+    umlaut are replaced, see _SPELLED_UMLAUT, so 'Feuer' or 'aktuell' are not expanded. Results are ordered by the
+    text score, which weighs matches in the title highest, see MuseumObject.
+    MongoDB does not report where a document matched, so highlights are found again in python with a light german
+    stemmer that only needs to agree with MongoDB's for the words of the query.
+"""
+
+# fields covered by the text index. highlights are searched in this order
+SEARCH_FIELDS = ('title', 'creator', 'material', 'description', 'interdisciplinary_context')
+# language of the text index and of the queries
+LANGUAGE = 'german'
+# maximum length of a highlight snippet in characters
+SNIPPET_LENGTH = 160
+
+_WORD = re.compile(r'\w+')
+_FOLD = str.maketrans({'ä': 'a', 'ö': 'o', 'ü': 'u', 'ß': 'ss'})
+_UMLAUTS = {'ae': 'ä', 'oe': 'ö', 'ue': 'ü'}
+# ae, oe and ue where they can spell an umlaut. not after a vowel or q, as in Feuer, Bauer or Quelle, and not in the
+# loanword ending uell after d, n, s, t, v or x, as in Duell, manuell or aktuell
+_SPELLED_UMLAUT = re.compile(r'(?<![aeiouyäöüq])(?:ae|oe|ue(?!ll)|(?<![dnstvx])ue)')
+# inflectional endings removed by the stemmer, longest first
+_SUFFIXES = ('ern', 'em', 'en', 'er', 'es', 'e', 's', 'n')
+
+
+def terms(query):
+    """ returns the words of the query and their umlaut spellings without duplicates """
+    result = []
+    for word in _WORD.findall(query.lower()):
+        variant = _SPELLED_UMLAUT.sub(lambda match: _UMLAUTS[match.group()], word)
+        for term in (word, variant):
+            if term not in result:
+                result.append(term)
+    return result
+
+
+def stem(word):
+    """ returns the lower case stem of a german word with umlauts folded """
+    word = word.lower().translate(_FOLD)
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _snippet(text, matches):
+    # window of SNIPPET_LENGTH characters that starts shortly before the first match, cut at word boundaries
+    start = max(0, matches[0].start() - SNIPPET_LENGTH // 4)
+    if start > 0:
+        boundary = text.rfind(' ', 0, start)
+        start = boundary + 1 if boundary >= 0 else 0
+    end = min(len(text), start + SNIPPET_LENGTH)
+    if end < len(text):
+        boundary = text.rfind(' ', start, end)
+        end = boundary if boundary > matches[0].end() else end
+    parts = ['…'] if start > 0 else []
+    position = start
+    for match in matches:
+        if match.start() < position or match.end() > end:
+            continue
+        parts.append(html.escape(text[position:match.start()]))
+        parts.append('<em>' + html.escape(match.group()) + '</em>')
+        position = match.end()
+    parts.append(html.escape(text[position:end]))
+    if end < len(text):
+        parts.append('…')
+    return ''.join(parts)
+
+
+def highlights(museum_object, stems):
+    """
+        returns (field, snippet) for every field of SEARCH_FIELDS in which a word has one of the stems. snippets are
+        html escaped with the matching words wrapped in <em>
+    """
+    result = []
+    for field in SEARCH_FIELDS:
+        text = getattr(museum_object, field, None)
+        if not text:
+            continue
+        matches = [match for match in _WORD.finditer(text) if stem(match.group()) in stems]
+        if matches:
+            result.append((field, _snippet(text, matches)))
+    return result
+
+
+def search(queryset, query, first=None, after=None):
+    """ returns a page of the objects in queryset that match the query as MuseumObjectSearchConnection """
+    words = terms(query)
+    if not words:
+        return ranked_connection(MuseumObjectSearchConnection, None)
+    stems = {stem(word) for word in words}
+    queryset = queryset.search_text(' '.join(words), language=LANGUAGE).order_by('$text_score')
+
+    def hit(museum_object):
+        return SearchHit(museum_object=museum_object, score=museum_object.get_text_score(),
+                         highlights=[Highlight(field=field, snippet=snippet)
+                                     for field, snippet in highlights(museum_object, stems)])
+
+    return ranked_connection(MuseumObjectSearchConnection, queryset, first, after, hit)
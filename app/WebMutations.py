@@ -21,6 +21,11 @@ from graphene_file_upload.scalars import Upload
 import string
 import random
 from app.ProtectedFields import StringField, ProtectedString, BooleanField, ProtectedBool
+from app.Loaders import get_or_none, forget
+from app.Checkpoints import delete_checkpoint
+from app.Badges import invalidate_catalogue
+from app.Images import delete_versions
+from app.BlobCache import invalidate
 from app.Fields import Tour, MuseumObject, Admin, User, Picture, Badge, CheckpointUnion, ProfilePicture
 
 """
@@ -103,7 +108,7 @@ class CreateMuseumObject(Mutation):
 
         if get_jwt_claims() == admin_claim:
 
-            if not MuseumObjectModel.objects(object_id=object_id):
+            if get_or_none(MuseumObjectModel, object_id=object_id) is None:
                 museum_object = MuseumObjectModel(object_id=object_id, category=category, sub_category=sub_category,
                                                   title=title, time_range=time_range, year=year,
                                                   art_type=art_type, creator=creator, material=material,
@@ -175,10 +180,10 @@ class UpdateMuseumObject(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, object_id, **kwargs):
         if get_jwt_claims() == admin_claim:
-            if not MuseumObjectModel.objects(object_id=object_id):
+            museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+            if museum_object is None:
                 return UpdateMuseumObject(ok=BooleanField(boolean=False), museum_object=None)
             else:
-                museum_object = MuseumObjectModel.objects.get(object_id=object_id)
                 category = kwargs.get('category', None)
                 sub_category = kwargs.get('sub_category', None)
                 title = kwargs.get('title', None)
@@ -205,8 +210,8 @@ class UpdateMuseumObject(Mutation):
                 if picture is not None:
                     pics = []
                     for pid in picture:
-                        if PictureModel.objects(id=pid):
-                            pic = PictureModel.objects.get(id=pid)
+                        pic = get_or_none(PictureModel, id=pid)
+                        if pic is not None:
                             pics.append(pic)
                         else:
                             return UpdateMuseumObject(ok=BooleanField(boolean=False), museum_object=None)
@@ -252,7 +257,7 @@ class CreateAdmin(Mutation):
     ok = Boolean()
 
     def mutate(self, info, username, password):
-        if not AdminModel.objects(username=username):
+        if get_or_none(AdminModel, username=username) is None:
             user = AdminModel(username=username, password=generate_password_hash(password))
             user.save()
             return CreateAdmin(user=user, ok=True)
@@ -281,19 +286,16 @@ class DeleteMuseumObject(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, object_id):
         if get_jwt_claims() == admin_claim:
-            if MuseumObjectModel.objects(object_id=object_id):
-                museum_object = MuseumObjectModel.objects.get(object_id=object_id)
+            museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+            if museum_object is not None:
                 pictures = museum_object.picture
-                # delete associated pictures
+                # delete associated pictures and their scaled versions
                 for picture in pictures:
+                    delete_versions(picture.picture)
+                    invalidate('Picture', picture.id)
                     picture.delete()
                 # delete object from user favourites
-                favourites = FavouritesModel.objects(favourite_objects__contains=museum_object)
-                for favourite in favourites:
-                    objects = favourite.favourite_objects
-                    objects.remove(museum_object)
-                    favourite.update(set__favourite_objects=objects)
-                    favourite.save()
+                FavouritesModel.objects(favourite_objects=museum_object).update(pull__favourite_objects=museum_object)
                 # delete object reference from questions
                 questions = QuestionModel.objects(linked_objects__contains=museum_object)
                 for question in questions:
@@ -303,24 +305,11 @@ class DeleteMuseumObject(Mutation):
                 # delete checkpoints that reference the object
                 checkpoints = ObjectCheckpointModel.objects(museum_object=museum_object)
                 for checkpoint in checkpoints:
-                    # update tour accordingly
-                    tour = checkpoint.tour
-                    max_idx = tour.current_checkpoints
-                    max_idx -= 1
-                    # reduce number of current checkpoints
-                    tour.update(set__current_checkpoints=max_idx)
-                    tour.save()
-                    index = checkpoint.index
-                    tour_checkpoints = CheckpointModel.objects(tour=tour)
-                    # adjust index of later checkpoints in the tour
-                    for cp in tour_checkpoints:
-                        if cp.index > index:
-                            cpidx = cp.index
-                            cpidx -= 1
-                            cp.update(set__index=cpidx)
-                            cp.save()
-                    checkpoint.delete()
+                    # only reduces the number of checkpoints in the tour. indices follow from the ranks
+                    delete_checkpoint(checkpoint)
+                    forget(checkpoint)
                 museum_object.delete()
+                forget(museum_object)
             return DeleteMuseumObject(ok=BooleanField(boolean=True))
 
         else:
@@ -345,8 +334,7 @@ class ChangePassword(Mutation):
     @classmethod
     @mutation_jwt_required
     def mutate(cls, _, info, password):
-        username = get_jwt_identity()
-        user = AdminModel.objects.get(username=username)
+        user = get_or_none(AdminModel, username=get_jwt_identity())
         # password is again saved as a hash
         user.update(set__password=generate_password_hash(password))
         user.save()
@@ -371,8 +359,8 @@ class Auth(Mutation):
 
     @classmethod
     def mutate(cls, _, info, username, password):
-        if not (AdminModel.objects(username=username) and check_password_hash(
-                AdminModel.objects.get(username=username).password, password)):
+        admin = get_or_none(AdminModel, username=username)
+        if not (admin is not None and check_password_hash(admin.password, password)):
             return Auth(ok=False)
         else:
             return Auth(access_token=create_access_token(username, user_claims=admin_claim),
@@ -454,11 +442,11 @@ class DemoteUser(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, username):
         if get_jwt_claims() == admin_claim:
-            if UserModel.objects(username=username):
-                user = UserModel.objects.get(username=username)
+            user = get_or_none(UserModel, username=username)
+            if user is not None:
                 user.update(set__producer=False)
                 user.save()
-                user = UserModel.objects.get(username=username)
+                user.reload()
                 return DemoteUser(ok=BooleanField(boolean=True), user=user)
             else:
                 return DemoteUser(ok=BooleanField(boolean=False), user=None)
@@ -493,9 +481,10 @@ class DeleteUser(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, username):
         if get_jwt_claims() == admin_claim:
-            if UserModel.objects(username=username):
-                user = UserModel.objects.get(username=username)
+            user = get_or_none(UserModel, username=username)
+            if user is not None:
                 user.delete()
+                forget(user)
             return DeleteUser(ok=BooleanField(boolean=True))
 
         else:
@@ -523,8 +512,8 @@ class DenyReview(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id):
         if get_jwt_claims() == admin_claim:
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
                 tour.update(set__status='private')
                 tour.save()
                 tour.reload()
@@ -556,8 +545,8 @@ class AcceptReview(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, tour_id):
         if get_jwt_claims() == admin_claim:
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
                 tour.update(set__status='featured')
                 tour.save()
                 tour.reload()
@@ -589,10 +578,10 @@ class ReadFeedback(Mutation):
     @mutation_jwt_required
     def mutate(cls, _, info, feedback_id):
         if get_jwt_claims() == admin_claim:
-            if not AppFeedbackModel.objects(id=feedback_id):
+            feedback = get_or_none(AppFeedbackModel, id=feedback_id)
+            if feedback is None:
                 return ReadFeedback(ok=BooleanField(boolean=False))
             else:
-                feedback = AppFeedbackModel.objects.get(id=feedback_id)
                 feedback.update(set__read=True)
                 feedback.save()
                 return ReadFeedback(ok=BooleanField(boolean=True))
@@ -632,17 +621,13 @@ class CreateBadge(Mutation):
         # ensure caller is admin
         if get_jwt_claims() == admin_claim:
             # ensure badge id is unique
-            if not BadgeModel.objects(id=badge_id):
+            if get_or_none(BadgeModel, id=badge_id) is None:
                 badge = BadgeModel(id=badge_id, name=name, description=description, cost=cost)
                 badge.picture.put(picture, content_type='image/png')
                 badge.save()
                 badge.reload()
-                # add badge to the progress dict of all users.
-                for user in UserModel.objects.all():
-                    badges = user.badge_progress
-                    badges[badge_id] = 0
-                    user.update(set__badge_progress=badges)
-                    user.save()
+                # users start without progress towards the badge, which needs no entry in their progress, see app.Badges
+                invalidate_catalogue()
                 return CreateBadge(badge=badge, ok=BooleanField(boolean=True))
             else:
                 return CreateBadge(badge=None, ok=BooleanField(boolean=False))
@@ -741,10 +726,9 @@ class UpdateBadge(Mutation):
         if not get_jwt_claims() == admin_claim:
             return UpdateBadge(badge=None, ok=BooleanField(boolean=False))
         # assert badge exists
-        if not BadgeModel.objects(id=badge_id):
+        badge = get_or_none(BadgeModel, id=badge_id)
+        if badge is None:
             return UpdateBadge(badge=None, ok=BooleanField(boolean=False))
-        # get badge to modify
-        badge = BadgeModel.objects.get(id=badge_id)
         # get optional parameters
         picture = kwargs.get('picture', None)
         name = kwargs.get('name', None)
@@ -753,8 +737,9 @@ class UpdateBadge(Mutation):
         new_id = kwargs.get('new_id', None)
         if new_id is not None:
             # ensure new badge id is also unique
-            if not BadgeModel.objects(id=new_id):
+            if get_or_none(BadgeModel, id=new_id) is None:
                 badge.update(set__id=new_id)
+                invalidate('Badge', badge_id)
             else:
                 return UpdateBadge(badge=None, ok=BooleanField(boolean=False))
         if name is not None:
@@ -764,8 +749,11 @@ class UpdateBadge(Mutation):
         if description is not None:
             badge.update(set__description=description)
         if picture is not None:
+            delete_versions(badge.picture)
+            invalidate('Badge', badge_id)
             badge.picture.replace(picture, content_type='image/png')
         badge.save()
+        invalidate_catalogue()
         # reload so updated object is returned
         badge.reload()
         return UpdateBadge(badge=badge, ok=BooleanField(boolean=True))
@@ -803,10 +791,9 @@ class UpdatePicture(Mutation):
         if not get_jwt_claims() == admin_claim:
             return UpdatePicture(picture=None, ok=BooleanField(boolean=False))
         # assert picture exists
-        if not PictureModel.objects(id=picture_id):
+        picture_object = get_or_none(PictureModel, id=picture_id)
+        if picture_object is None:
             return UpdatePicture(picture=None, ok=BooleanField(boolean=False))
-        # get object to modify
-        picture_object = PictureModel.objects.get(id=picture_id)
         # get optional parameters
         picture = kwargs.get('picture', None)
         description = kwargs.get('description', None)
@@ -814,6 +801,8 @@ class UpdatePicture(Mutation):
         if description is not None:
             picture_object.update(set__description=description)
         if picture is not None:
+            delete_versions(picture_object.picture)
+            invalidate('Picture', picture_id)
             picture_object.picture.replace(picture, content_type='image/jpeg')
         picture_object.save()
         # reload so updated object is returned
@@ -851,10 +840,11 @@ class UpdateProfilePicture(Mutation):
         if not get_jwt_claims() == admin_claim:
             return UpdateProfilePicture(picture=None, ok=BooleanField(boolean=False))
         # assert object exists
-        if not ProfilePictureModel.objects(id=picture_id):
+        profile_picture = get_or_none(ProfilePictureModel, id=picture_id)
+        if profile_picture is None:
             return UpdateProfilePicture(picture=None, ok=BooleanField(boolean=False))
-        # get object to modify
-        profile_picture = ProfilePictureModel.objects.get(id=picture_id)
+        delete_versions(profile_picture.picture)
+        invalidate('ProfilePicture', picture_id)
         profile_picture.picture.replace(picture, content_type='image/jpeg')
         profile_picture.save()
         # reload so updated object is returned
@@ -910,10 +900,9 @@ class EditCheckpoint(Mutation):
         if not get_jwt_claims() == admin_claim:
             return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
         # assert checkpoint exists
-        if not CheckpointModel.objects(id=checkpoint_id):
+        checkpoint = get_or_none(CheckpointModel, id=checkpoint_id)
+        if checkpoint is None:
             return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-        # get checkpoint object
-        checkpoint = CheckpointModel.objects.get(id=checkpoint_id)
         # get all the optional arguments
         text = kwargs.get('text', None)
         object_id = kwargs.get('object_id', None)
@@ -941,9 +930,9 @@ class EditCheckpoint(Mutation):
         if isinstance(checkpoint, ObjectCheckpointModel):
             # assert new object exists
             if object_id is not None:
-                if not MuseumObjectModel.objects(object_id=object_id):
+                museum_object = get_or_none(MuseumObjectModel, object_id=object_id)
+                if museum_object is None:
                     return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-                museum_object = MuseumObjectModel.objects.get(object_id=object_id)
                 checkpoint.update(set__museum_object=museum_object)
             checkpoint.save()
             checkpoint.reload()
@@ -951,9 +940,9 @@ class EditCheckpoint(Mutation):
         elif isinstance(checkpoint, PictureCheckpointModel):
             # assert new picture exists
             if picture_id is not None:
-                if not PictureModel.objects(id=picture_id):
+                pic = get_or_none(PictureModel, id=picture_id)
+                if pic is None:
                     return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
-                pic = PictureModel.objects.get(id=picture_id)
                 checkpoint.update(set__picture=pic)
             if text is not None:
                 checkpoint.update(set__text=text)
@@ -975,10 +964,11 @@ class EditCheckpoint(Mutation):
             if linked_objects is not None:
                 new_links = []
                 for oid in linked_objects:
-                    if not MuseumObjectModel.objects(object_id=oid):
+                    museum_object = get_or_none(MuseumObjectModel, object_id=oid)
+                    if museum_object is None:
                         return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
                     else:
-                        new_links.append(MuseumObjectModel.objects.get(object_id=oid))
+                        new_links.append(museum_object)
                 checkpoint.update(set__linked_objects=new_links)
             checkpoint.save()
             checkpoint.reload()
@@ -989,10 +979,11 @@ class EditCheckpoint(Mutation):
             if linked_objects is not None:
                 new_links = []
                 for oid in linked_objects:
-                    if not MuseumObjectModel.objects(object_id=oid):
+                    museum_object = get_or_none(MuseumObjectModel, object_id=oid)
+                    if museum_object is None:
                         return EditCheckpoint(checkpoint=None, ok=BooleanField(boolean=False))
                     else:
-                        new_links.append(MuseumObjectModel.objects.get(object_id=oid))
+                        new_links.append(museum_object)
                 checkpoint.update(set__linked_objects=new_links)
             checkpoint.save()
             checkpoint.reload()
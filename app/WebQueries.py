@@ -1,6 +1,7 @@
 from flask_graphql_auth import query_jwt_required, get_jwt_claims
-from graphene import ObjectType, List, String
-from app.Fields import Tour, MuseumObject, Code, AppFeedback, TourFeedback, CheckpointUnion
+from graphene import ObjectType, List, String, Int, Field
+from app.Fields import Tour, MuseumObject, Code, AppFeedback, TourFeedback, CheckpointUnion, TourConnection, \
+    CodeConnection, AppFeedbackConnection, MuseumObjectSearchConnection, ObjectFacets
 from models.AppFeedback import AppFeedback as AppFeedbackModel
 from models.Tour import Tour as TourModel
 from models.Code import Code as CodeModel
@@ -8,6 +9,13 @@ from models.TourFeedback import TourFeedback as TourFeedbackModel
 from models.MuseumObject import MuseumObject as MuseumObjectModel
 from models.Checkpoint import Checkpoint as CheckpointModel
 from app.WebMutations import admin_claim
+from app.Loaders import get_or_none
+from app.Projection import project
+from app.Pagination import connection
+from app.Checkpoints import in_order, number
+from app.AppQueries import museum_object_arguments, filter_museum_objects
+from app.Search import search
+from app.Facets import object_facets
 
 
 class Query(ObjectType):
@@ -21,6 +29,12 @@ class Query(ObjectType):
     unread_feedback = List(AppFeedback, token=String())
     """ returns all promotion codes currently available in the database"""
     codes = List(Code, token=String())
+    """ paginated versions of pending, feedback, unread_feedback, codes and all_tours. see app.Pagination """
+    pending_connection = Field(TourConnection, token=String(), first=Int(), after=String())
+    feedback_connection = Field(AppFeedbackConnection, token=String(), first=Int(), after=String())
+    unread_feedback_connection = Field(AppFeedbackConnection, token=String(), first=Int(), after=String())
+    codes_connection = Field(CodeConnection, token=String(), first=Int(), after=String())
+    all_tours_connection = Field(TourConnection, token=String(), first=Int(), after=String())
     """ allows admins to query all feedback for any tour e.g. to assist in the review process"""
     tour_feedback = List(TourFeedback, tour_id=String(), token=String())
     """ allows admins to query any tour """
@@ -38,46 +52,70 @@ class Query(ObjectType):
         value in the database.
     """
 
-    museum_object = List(MuseumObject, object_id=String(),
-                         category=String(),
-                         sub_category=String(),
-                         title=String(),
-                         token=String(required=True),
-                         year=String(),
-                         art_type=String(),
-                         creator=String(),
-                         material=String(),
-                         time_range=String(),
-                         location=String(),
-                         description=String(),
-                         interdisciplinary_context=String(),
-                         additional_information=String(),
-                         size=String())
-
+    museum_object = List(MuseumObject, token=String(required=True), **museum_object_arguments())
+    """ full text search over the objects, see searchObjects of the app API """
+    search_objects = Field(MuseumObjectSearchConnection, token=String(required=True), query=String(required=True),
+                           first=Int(), after=String(), **museum_object_arguments())
+    """ numbers of objects per category, sub category, art type, material and creator among the objects matching the
+        parameters, which filter like those of museum_object. meant for browsing the catalogue
+    """
+    object_facets = Field(ObjectFacets, token=String(required=True), **museum_object_arguments())
 
     @classmethod
     @query_jwt_required
     def resolve_codes(cls, _, info):
         if get_jwt_claims() == admin_claim:
-            return list(CodeModel.objects.all())
+            return list(project(CodeModel.objects.all(), info))
         else:
             return []
 
+    @classmethod
+    @query_jwt_required
+    def resolve_codes_connection(cls, _, info, first=None, after=None):
+        if get_jwt_claims() == admin_claim:
+            return connection(CodeConnection, CodeModel.objects, info, first, after)
+        return connection(CodeConnection, None)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_feedback_connection(cls, _, info, first=None, after=None):
+        if get_jwt_claims() == admin_claim:
+            return connection(AppFeedbackConnection, AppFeedbackModel.objects, info, first, after)
+        return connection(AppFeedbackConnection, None)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_unread_feedback_connection(cls, _, info, first=None, after=None):
+        if get_jwt_claims() == admin_claim:
+            return connection(AppFeedbackConnection, AppFeedbackModel.objects(read=False), info, first, after)
+        return connection(AppFeedbackConnection, None)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_pending_connection(cls, _, info, first=None, after=None):
+        if get_jwt_claims() == admin_claim:
+            return connection(TourConnection, TourModel.objects(status='pending'), info, first, after)
+        return connection(TourConnection, None)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_all_tours_connection(cls, _, info, first=None, after=None):
+        return connection(TourConnection, TourModel.objects, info, first, after)
+
     @classmethod
     @query_jwt_required
     def resolve_tour_feedback(cls, _, info, tour_id):
         if get_jwt_claims() == admin_claim:
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
-                if TourFeedbackModel.objects(tour=tour):
-                    return list(TourFeedbackModel.objects(tour=tour))
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
+                return list(project(TourFeedbackModel.objects(tour=tour), info))
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_feedback(cls, _, info):
         if get_jwt_claims() == admin_claim:
-            return list(AppFeedbackModel.objects.all())
+            return list(project(AppFeedbackModel.objects.all(), info))
         else:
             return []
 
@@ -85,7 +123,7 @@ class Query(ObjectType):
     @query_jwt_required
     def resolve_unread_feedback(cls, _, info):
         if get_jwt_claims() == admin_claim:
-            return list(AppFeedbackModel.objects(read=False))
+            return list(project(AppFeedbackModel.objects(read=False), info))
         else:
             return []
 
@@ -93,7 +131,7 @@ class Query(ObjectType):
     @query_jwt_required
     def resolve_featured(cls, _, info):
         if get_jwt_claims() == admin_claim:
-            return list(TourModel.objects(status='featured'))
+            return list(project(TourModel.objects(status='featured'), info))
         else:
             return []
 
@@ -101,7 +139,7 @@ class Query(ObjectType):
     @query_jwt_required
     def resolve_pending(cls, _, info):
         if get_jwt_claims() == admin_claim:
-            return list(TourModel.objects(status='pending'))
+            return list(project(TourModel.objects(status='pending'), info))
         else:
             return []
 
@@ -109,84 +147,51 @@ class Query(ObjectType):
     @query_jwt_required
     def resolve_tour(cls, _, info, tour_id):
         if get_jwt_claims() == admin_claim:
-            if TourModel.objects(id=tour_id):
-                return list(TourModel.objects(id=tour_id))
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
+                return [tour]
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_all_tours(cls, _, info):
-        return TourModel.objects.all()
+        return project(TourModel.objects, info)
 
     @classmethod
     @query_jwt_required
     def resolve_museum_object(cls, _, info, **kwargs):
-        object_id = kwargs.get('object_id', None)
-        category = kwargs.get('category', None)
-        sub_category = kwargs.get('sub_category', None)
-        title = kwargs.get('title', None)
-        year = kwargs.get('year', None)
-        art_type = kwargs.get('art_type', None)
-        creator = kwargs.get('creator', None)
-        material = kwargs.get('material', None)
-        location = kwargs.get('location', None)
-        description = kwargs.get('description', None)
-        interdisciplinary_context = kwargs.get('interdisciplinary_context', None)
-        time_range = kwargs.get('time_range', None)
-        additional_information = kwargs.get('additional_information', None)
-        size = kwargs.get('size', None)
-
-        result = MuseumObjectModel.objects.all()
-        if object_id is not None:
-            result = result(object_id=object_id)
-        if category is not None:
-            result = result(category=category)
-        if sub_category is not None:
-            result = result(sub_category=sub_category)
-        if title is not None:
-            result = result(title=title)
-        if year is not None:
-            result = result(year=year)
-        if art_type is not None:
-            result = result(art_type=art_type)
-        if creator is not None:
-            result = result(creator=creator)
-        if material is not None:
-            result = result(material=material)
-        if time_range is not None:
-            result = result(time_range=time_range)
-        if location is not None:
-            result = result(location=location)
-        if description is not None:
-            result = result(description=description)
-        if interdisciplinary_context is not None:
-            result = result(interdisciplinary_context=interdisciplinary_context)
-        if additional_information is not None:
-            result = result(additional_information=additional_information)
-        if size is not None:
-            result = result(size_=size)
-        return list(result)
+        return list(project(filter_museum_objects(kwargs), info))
+
+    @classmethod
+    @query_jwt_required
+    def resolve_search_objects(cls, _, info, query, first=None, after=None, **kwargs):
+        return search(filter_museum_objects(kwargs), query, first, after)
+
+    @classmethod
+    @query_jwt_required
+    def resolve_object_facets(cls, _, info, **kwargs):
+        return object_facets(filter_museum_objects(kwargs))
 
     @classmethod
     @query_jwt_required
     def resolve_checkpoint(cls, _,  info, checkpoint_id):
         if get_jwt_claims() == admin_claim:
-            if CheckpointModel.objects(id=checkpoint_id):
-                return list(CheckpointModel.objects(id=checkpoint_id))
+            checkpoint = get_or_none(CheckpointModel, id=checkpoint_id)
+            if checkpoint is not None:
+                return [checkpoint]
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_checkpoints_by_tour(cls, _, info, tour_id):
         if get_jwt_claims() == admin_claim:
-            if TourModel.objects(id=tour_id):
-                tour = TourModel.objects.get(id=tour_id)
-                if CheckpointModel.objects(tour=tour):
-                    return list(CheckpointModel.objects(tour=tour))
+            tour = get_or_none(TourModel, id=tour_id)
+            if tour is not None:
+                return number(project(in_order(tour), info))
         return []
 
     @classmethod
     @query_jwt_required
     def resolve_all_objects(cls, _, info):
-        return MuseumObjectModel.objects.all()
+        return project(MuseumObjectModel.objects, info)
 
@@ -1,14 +1,17 @@
-import os
+import argparse
 import mongoengine
 from flask_mongoengine import MongoEngine
 from mongoengine import register_connection
 from models.Badge import Badge
+from app.Images import delete_versions
+from ingest_sync import Report, file_digests, picture_files, put_picture
 
 """
 Ingestion script for badges. Allows adding profile pictures to the database in bulk. Pictures are assumed to 
 be in png format and located at data/badges relative to the location of this script.
 Name and id for the badge are inferred from file name. Cost for now is fixed for bronze, silver, gold badge levels 
- 
+Run with --sync to only upload new and changed pictures and report removed badges. The name and cost of existing
+badges are left as they are, they may have been edited in the web portal. see ingest_sync
 """
 
 # connect to database. assumes default port and no password
@@ -17,51 +20,47 @@ mongoengine.connect(host='localhost:27017')
 register_connection("file", "file")
 
 
-def ingest_badges():
+def ingest_badges(sync=False):
+    report = Report('badges')
+    existing = {badge.id: badge for badge in Badge.objects} if sync else {}
     # data path relative to this script
-    file_path = 'data/badges'
-    # iterating through the directory
-    with os.scandir(file_path) as directory:
-        for file in directory:
-            # ignoring subdirectories
-            if file.is_file():
-                # ignoring non-png files. for first batch of badges different formats were provided.
-                # for later additions if no png files are provided they will have to be converted to png
-                if file.path.endswith('png'):
-                    # get the actual data
-                    # using with to ensure to file is closed
-                    # mode HAS to be rb for mongoengine to be able to read the file
-                    with open(file.path, 'rb') as picture:
-                        # getting file name without extension
-                        name = file.name[:-4]
-                        # based on file name infer level and thus cost of the badge
-                        if 'bronze' in name:
-                            cost = 3
-                        elif 'silber' in name:
-                            cost = 10
-                        elif 'gold' in name:
-                            cost = 30
-                        else:
-                            cost = 100
-                        # define document. needs these parameters to be created
-                        badge = Badge(id=name, name=name, cost=cost)
-                        # adding data to GridFS FileField
-                        badge.picture.put(picture, content_type='image/png')
-                        # saving
-                        badge.save()
-                        # reloading to get id
-                        badge.reload()
-                        # TODO: Ideally we would add a new badge to all the user badge_progress dictionaries.
-                        #       However this results in a cyclic import here because of the initialization of that dict
-                        #       with all badges objects in models.User. The createBadge function in app.WebMutations
-                        #       and the upload function in museum_app.file do not have this problem.
-                        #for user in User.objects.all():
-                           # badges = user.badge_progress
-                            #badges[str(id)] = 0
-                            #user.update(set__badge_progress=badges)
-                            #user.save()
-                        # printing id for feedback on if the script is working.
-                        print(badge.id)
+    # ignoring non-png files. for first batch of badges different formats were provided.
+    # for later additions if no png files are provided they will have to be converted to png
+    for file_name, path in picture_files('data/badges', 'png'):
+        # getting file name without extension
+        name = file_name[:-4]
+        sha256, _ = file_digests(path)
+        badge = existing.pop(name, None)
+        if badge is not None and badge.sha256 == sha256:
+            report.unchanged += 1
+            continue
+        if badge is None:
+            # based on file name infer level and thus cost of the badge
+            if 'bronze' in name:
+                cost = 3
+            elif 'silber' in name:
+                cost = 10
+            elif 'gold' in name:
+                cost = 30
+            else:
+                cost = 100
+            # define document. needs these parameters to be created
+            badge = Badge(id=name, name=name, cost=cost)
+            report.inserted += 1
+        else:
+            delete_versions(badge.picture)
+            report.updated += 1
+        badge.sha256 = sha256
+        # adding data to GridFS FileField
+        put_picture(badge, path, 'image/png')
+        badge.save()
+        # users do not need an entry for the new badge, missing badges count as no progress
+        # printing id for feedback on if the script is working.
+        print(badge.id)
+    report.removed.extend(sorted(existing))
+    report.print()
 
 
-ingest_badges()
+parser = argparse.ArgumentParser(description='Ingests the badges in data/badges.')
+parser.add_argument('--sync', action='store_true', help='only upload new and changed badges and report removed ones')
+ingest_badges(parser.parse_args().sync)
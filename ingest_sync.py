@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from app.Images import delete_versions
+"""
+Helpers shared by the ingestion scripts.
+Every ingested item remembers the SHA-256 of its source: pictures and badges that of their file, museum objects that
+of their spreadsheet row. Run with --sync, the scripts compare the hashes of the source files with the stored ones.
+Unchanged items are skipped, changed ones updated in place and new ones inserted, so a sync only moves the delta.
+Items whose source is gone are reported as removed but not deleted, as users and tours may still reference
+them. Pictures ingested before the hashes were stored are matched to their file by the md5 GridFS keeps.
+"""
+
+# number of pictures uploaded to GridFS at the same time
+UPLOAD_WORKERS = 8
+# bytes read from a file at once while hashing
+READ_SIZE = 1024 * 1024
+
+
+def file_digests(path):
+    """ returns the SHA-256 and the md5 of the file at path as hex strings. the file is only read once """
+    sha256 = hashlib.sha256()
+    md5 = hashlib.md5()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(READ_SIZE), b''):
+            sha256.update(block)
+            md5.update(block)
+    return sha256.hexdigest(), md5.hexdigest()
+
+
+def row_sha256(values):
+    """ returns the SHA-256 of the cells of a spreadsheet row as hex string """
+    return hashlib.sha256(json.dumps([str(value) for value in values]).encode('utf-8')).hexdigest()
+
+
+class Report:
+    """ counts what an ingestion did to the items of one kind and prints it. invalid items are skipped """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.removed = []
+        self.invalid = []
+
+    def print(self):
+        print('{}: {} inserted, {} updated, {} unchanged, {} removed from the source, {} invalid'.format(
+            self.kind, self.inserted, self.updated, self.unchanged, len(self.removed), len(self.invalid)))
+        for name in self.removed:
+            print('    removed: {}'.format(name))
+        for problem in self.invalid:
+            print('    invalid: {}'.format(problem))
+
+
+def put_picture(document, path, content_type):
+    """ stores the file at path in the picture FileField of document, replacing the picture it had """
+    # mode HAS to be rb for mongoengine to be able to read the bytes
+    with open(path, 'rb') as file:
+        if document.picture.grid_id is None:
+            document.picture.put(file, content_type=content_type)
+        else:
+            document.picture.replace(file, content_type=content_type)
+    return document
+
+
+def upload(documents, paths, content_type):
+    """
+        stores the file at each path in the picture FileField of the document at the same position, replacing the
+        picture it had. uploads UPLOAD_WORKERS files at the same time. pymongo is thread safe and the uploads mostly
+        wait on the network
+    """
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as pool:
+        list(pool.map(put_picture, documents, paths, [content_type] * len(paths)))
+
+
+def _legacy(model):
+    """ returns the documents of model without source by the md5 of their picture """
+    legacy = {}
+    for document in model.objects(source=None):
+        grid_out = document.picture.get()
+        if grid_out is not None and grid_out.md5:
+            legacy[grid_out.md5] = document
+    return legacy
+
+
+def sync_pictures(model, files, content_type, report, sync=True):
+    """
+        ingests the pictures in files, a list of (name, path), as documents of model, which has the fields picture,
+        source and sha256. source holds the file name. without sync every file gets a new document, as the scripts
+        always did. returns a dictionary from file name to document id
+    """
+    documents = {}
+    existing = {document.source: document for document in model.objects(source__ne=None)} if sync else {}
+    legacy = _legacy(model) if sync else {}
+    new, changed = [], []
+    for name, path in files:
+        sha256, md5 = file_digests(path)
+        document = existing.get(name)
+        if document is None and md5 in legacy:
+            # same file as a picture ingested before hashes were stored. only needs to remember its source
+            document = legacy.pop(md5)
+            document.update(set__source=name, set__sha256=sha256)
+            report.unchanged += 1
+        elif document is None:
+            document = model(source=name, sha256=sha256)
+            new.append((document, path))
+        elif document.sha256 == sha256:
+            report.unchanged += 1
+        else:
+            delete_versions(document.picture)
+            document.sha256 = sha256
+            changed.append((document, path))
+        documents[name] = document
+    upload([document for document, _ in new + changed], [path for _, path in new + changed], content_type)
+    if new:
+        ids = model.objects.insert([document for document, _ in new], load_bulk=False)
+        for (document, _), id in zip(new, ids):
+            document.id = id
+    for document, _ in changed:
+        document.save()
+    report.inserted += len(new)
+    report.updated += len(changed)
+    report.removed.extend(sorted(set(existing) - set(documents)))
+    return {name: document.id for name, document in documents.items()}
+
+
+def picture_files(directory, extension):
+    """ returns (name, path) of the files in directory with the extension. sub directories are ignored """
+    with os.scandir(directory) as entries:
+        return sorted((entry.name, entry.path) for entry in entries
+                      if entry.is_file() and entry.name.endswith(extension))
@@ -12,7 +12,13 @@ class Answer(Document):
     """
     meta = {'db_alias': 'tour',
             'collection': 'answer',
-            'allow_inheritance': True
+            'allow_inheritance': True,
+            # answers are looked up by question, by user and by the pair of both when a user answers a question.
+            # the compound index covers the first two shapes as well. answers to a question are paged by id,
+            # see app.Pagination
+            'indexes': [('question', 'user'), ('question', 'id'), 'user'],
+            # a question only ever has answers of a single type so _cls does not need to be part of the indexes
+            'index_cls': False
             }
     question = ReferenceField(document_type=Question, required=True, reverse_delete_rule=CASCADE)
     user = ReferenceField(document_type=User, required=True, reverse_delete_rule=CASCADE)
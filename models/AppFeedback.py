@@ -6,7 +6,9 @@ class AppFeedback(Document):
           Template for an app-feedback object in the Database.
     """
     meta = {'db_alias': 'feedback',
-            'collection': 'feedback'}
+            'collection': 'feedback',
+            # admins only query unread feedback. paged by id, see app.Pagination
+            'indexes': [('read', 'id')]}
     # scale is also enforced upon creation
     rating = IntField(required=True, min_value=1, max_value=5)
     review = StringField(required=True)
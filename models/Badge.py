@@ -16,3 +16,5 @@ class Badge(Document):
     # currently not used in the first set of badges
     description = StringField()
     cost = IntField(required=True)
+    # SHA-256 of the file the badge was ingested from. see ingest_sync
+    sha256 = StringField()
@@ -9,10 +9,17 @@ class Checkpoint(Document):
     """
     meta = {'db_alias': 'tour',
             'collection': 'checkpoint',
-            'allow_inheritance': True}
+            'allow_inheritance': True,
+            # checkpoints are listed by tour in the order of their rank. see app.Checkpoints
+            'indexes': [('tour', 'rank')],
+            # subclasses share this collection and are always queried through the tour, not their type
+            'index_cls': False,
+            # checkpoints stored before ranks existed carry an index until flask checkpoints rebalance removes it
+            'strict': False}
     tour = ReferenceField(document_type=Tour, reverse_delete_rule=CASCADE)
     text = StringField()
-    index = IntField(default=0)
+    # position in the tour. the dense index shown to users is computed from this, see app.Checkpoints
+    rank = FloatField(default=0)
     show_text = BooleanField(default=False)
     show_picture = BooleanField(default=False)
     show_details = BooleanField(default=False)
@@ -0,0 +1,17 @@
+from mongoengine import *
+
+
+class Derivative(Document):
+    """
+        Scaled or converted version of a picture, badge or profile picture. Created by app.Images on first request.
+    """
+    meta = {'db_alias': 'file',
+            'collection': 'derivative',
+            # a version is looked up by the file it was made from, its width and its format
+            'indexes': [{'fields': ['source', 'width', 'format'], 'unique': True}]}
+    # GridFS id of the original file. replaced originals get a new id, so versions of the old file are never served
+    source = ObjectIdField(required=True)
+    width = IntField(required=True)
+    # 'jpeg', 'webp' or 'png'
+    format = StringField(required=True)
+    picture = FileField()
@@ -12,7 +12,9 @@ class Favourites(Document):
         any of the ways typically suggested.
     """
     meta = {'db_alias': 'user',
-            'collection': 'favourites'}
+            'collection': 'favourites',
+            # the user is the primary key. favourites are searched by object when the object is deleted
+            'indexes': ['favourite_objects']}
     user = ReferenceField(document_type=User, reverse_delete_rule=CASCADE, primary_key=True, required=True)
     favourite_tours = ListField(ReferenceField(document_type=Tour, reverse_delete_rule=PULL))
     favourite_objects = ListField(ReferenceField(document_type=MuseumObject, reverse_delete_rule=PULL))
@@ -13,7 +13,12 @@ class MuseumObject(Document):
     # 'Sammlungsbereich' in the museum. could reasonably be an enum as well
     sub_category = StringField(required=True)
     meta = {'db_alias': 'object',
-            'collection': 'object'}
+            'collection': 'object',
+            # text index for app.Search. the title weighs most when ranking results
+            'indexes': [{'fields': ['$title', '$creator', '$material', '$description', '$interdisciplinary_context'],
+                         'default_language': 'german',
+                         'weights': {'title': 10, 'creator': 5, 'material': 3, 'description': 1,
+                                     'interdisciplinary_context': 1}}]}
     title = StringField(required=True)
     # currently not used by app or web frontend
     time_range = StringField()
@@ -29,5 +34,7 @@ class MuseumObject(Document):
     # also currently not used by frontends
     additional_information = StringField()
     interdisciplinary_context = StringField()
+    # SHA-256 of the spreadsheet row the object was ingested from. see ingest_sync
+    sha256 = StringField()
 
 
@@ -7,4 +7,6 @@ class ObjectCheckpoint(Checkpoint):
     """
         Wraps a museum object as a checkpoint. Inherits all fields from checkpoint and is thus saved in tour.checkpoint
     """
+    # needed to find the checkpoints of an object when it is deleted
+    meta = {'indexes': ['museum_object']}
     museum_object = ReferenceField(document_type=MuseumObject, reverse_delete_rule=CASCADE)
@@ -0,0 +1,19 @@
+from datetime import datetime
+from mongoengine import *
+
+# seconds after their last use at which registered queries are deleted by MongoDB
+EXPIRE_AFTER = 30 * 24 * 60 * 60
+
+
+class PersistedQuery(Document):
+    """
+    GraphQL query registered by a client for automatic persisted queries. see museum_app.persisted
+    """
+    meta = {'db_alias': 'file',
+            'collection': 'persistedquery',
+            'indexes': [{'fields': ['used'], 'expireAfterSeconds': EXPIRE_AFTER}]}
+    # SHA-256 of the query as hex string, as sent by clients
+    id = StringField(required=True, primary_key=True)
+    query = StringField(required=True)
+    # last time a node loaded the query from the database. nodes serve it from their cache in between
+    used = DateTimeField(default=datetime.utcnow)
@@ -10,3 +10,6 @@ class Picture(Document):
     picture = FileField(content_type='image/jpeg')
     # currently not used anymore.
     description = StringField()
+    # file name and SHA-256 of the file the picture was ingested from. see ingest_sync
+    source = StringField()
+    sha256 = StringField()
@@ -10,3 +10,6 @@ class ProfilePicture(Document):
     meta = {'db_alias': 'file',
             'collection': 'profilepicture'}
     picture = FileField(content_type='image/jpeg')
+    # file name and SHA-256 of the file the picture was ingested from. see ingest_sync
+    source = StringField()
+    sha256 = StringField()
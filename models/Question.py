@@ -11,6 +11,8 @@ class Question(Checkpoint):
         This and all subclasses inherit from Checkpoint meaning they are linked to a Tour and stored in tour.checkpoints
     """
     # allows inheritance to allow basin MultipleChoiceQuestions on this
-    meta = {'allow_inheritance': True}
+    meta = {'allow_inheritance': True,
+            # needed to find the questions linking an object when it is deleted
+            'indexes': ['linked_objects']}
     question = StringField(required=True)
     linked_objects = ListField(ReferenceField(document_type=MuseumObject, reverse_delete_rule=PULL))
@@ -8,14 +8,17 @@ class Tour(Document):
     Template for a tour in the Database.
     """
     meta = {'db_alias': 'tour',
-            'collection': 'tour'}
+            'collection': 'tour',
+            # featured and pending tours are listed by status, users list the tours they own and joined.
+            # the lists are paged by id, see app.Pagination
+            'indexes': [('status', 'id'), ('owner', 'id'), ('users', 'id')]}
     name = StringField(required=True)
     owner = ReferenceField(document_type=User, required=True, reverse_delete_rule=CASCADE)
     # this is how users find the tour. uniqueness is also enforced in the creation function
     search_id = StringField(required=True, unique=True)
     # password users use to join the tour. can be changed later. featured tours can be joined without session id
     session_id = IntField(required=True)
-    # notably includes the owner
+    # notably includes the owner. stored as user ids, membership is checked and changed through app.Members
     users = ListField(ReferenceField(document_type=User, reverse_delete_rule=PULL))
     # alternatives: 'pending' and 'featured'. used for the review system
     status = StringField(default='private')
@@ -25,3 +28,6 @@ class Tour(Document):
     creation = DateTimeField(default=datetime.datetime.utcnow)
     # this is managed by checkpoint creation and modification methods
     current_checkpoints = IntField(default=0)
+    # upper bound of the ranks of the checkpoints in the tour, raised to reserve the rank of appended checkpoints.
+    # managed by app.Checkpoints
+    last_rank = FloatField(default=0)
@@ -7,7 +7,9 @@ class TourFeedback(Document):
          Template for a tour-feedback object in the Database.
     """
     meta = {'db_alias': 'tour',
-            'collection': 'feedback'}
+            'collection': 'feedback',
+            # paged by id, see app.Pagination
+            'indexes': [('tour', 'id')]}
     tour = ReferenceField(document_type=Tour, reverse_delete_rule=CASCADE)
     # scale 1-5 is also enforced in the creation function
     rating = IntField(required=True, min_value=1, max_value=5)
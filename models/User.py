@@ -2,10 +2,6 @@ from mongoengine import *
 from models.Badge import Badge
 from models.ProfilePicture import ProfilePicture
 
-badge_dict = {}
-for badge in Badge.objects.all():
-    badge_dict[badge.id] = 0
-
 
 class User(Document):
     """
@@ -25,5 +21,6 @@ class User(Document):
     #       to use as default. Seems unsafe to hardcode this if database changes though.
     #       Could maybe also register a new delete rule that resets it to a default picture if the chose one is deleted.
     profile_picture = ReferenceField(document_type=ProfilePicture, reverse_delete_rule=NULLIFY)
-    # initialized with all badges that exist upon creation. when new badges are created they are added for all users
-    badge_progress = DictField(default=badge_dict)
+    # maps badge ids to the progress towards the badge. badges without an entry count as no progress, so new badges
+    # are not added to the users. read through app.Badges
+    badge_progress = DictField()
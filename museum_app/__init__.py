@@ -3,8 +3,9 @@ from flask_graphql_auth import GraphQLAuth
 import os
 from .extensions import mongo
 from app.Schema import web_schema, app_schema
-from graphene_file_upload.flask import FileUploadGraphQLView
+from museum_app.persisted import PersistedQueryGraphQLView, CachedBackend, DEFAULT_CACHE_SIZE
 from museum_app.file import fileBP
+from museum_app.commands import index_cli, checkpoint_cli
 from flask_jwt_extended import JWTManager
 
 
@@ -17,20 +18,23 @@ def create_app(config_object='museum_app.settings'):
     # flask-jwt-extended bind
     jwt = JWTManager(app)
 
-    # Endpoints
+    # Endpoints. both accept automatic persisted queries, see museum_app.persisted
+    cache_size = app.config.get('GRAPHQL_DOCUMENT_CACHE_SIZE', DEFAULT_CACHE_SIZE)
     app.add_url_rule(
         '/web/',
-        view_func=FileUploadGraphQLView.as_view(
+        view_func=PersistedQueryGraphQLView.as_view(
             'web',
             schema=web_schema,
+            backend=CachedBackend(cache_size),
             graphiql=False
         )
     )
     app.add_url_rule(
         '/app/',
-        view_func=FileUploadGraphQLView.as_view(
+        view_func=PersistedQueryGraphQLView.as_view(
             'app',
             schema=app_schema,
+            backend=CachedBackend(cache_size),
             graphiql=False
         )
     )
@@ -41,5 +45,8 @@ def create_app(config_object='museum_app.settings'):
 
     # bind for alternative file up&download. routes found in museum_app.file
     app.register_blueprint(fileBP)
+    # maintenance commands. run with flask <group> <command>, see museum_app.commands
+    app.cli.add_command(index_cli)
+    app.cli.add_command(checkpoint_cli)
     return app
 
@@ -0,0 +1,123 @@
+import click
+from bson import ObjectId
+from flask.cli import AppGroup
+from models.Admin import Admin
+from models.Answer import Answer
+from models.AppFeedback import AppFeedback
+from models.Badge import Badge
+from models.Checkpoint import Checkpoint
+from models.Code import Code
+from models.Derivative import Derivative
+from models.Favourites import Favourites
+from models.MultipleChoiceAnswer import MultipleChoiceAnswer
+from models.MultipleChoiceQuestion import MultipleChoiceQuestion
+from models.MuseumObject import MuseumObject
+from models.PersistedQuery import PersistedQuery
+from models.ObjectCheckpoint import ObjectCheckpoint
+from models.Picture import Picture
+from models.PictureCheckpoint import PictureCheckpoint
+from models.ProfilePicture import ProfilePicture
+from models.Question import Question
+from models.Tour import Tour
+from models.TourFeedback import TourFeedback
+from models.User import User
+from app.Checkpoints import rebalance
+"""
+    Command line interface for maintenance tasks. Commands are registered on the app in create_app and run with
+    flask <group> <command>, e.g. flask indexes create.
+"""
+
+index_cli = AppGroup('indexes', help='Create and verify the indexes declared in the models.')
+checkpoint_cli = AppGroup('checkpoints', help='Maintain the order of checkpoints in tours.')
+
+# every model including subclasses as their indexes are declared on the subclass but live in the parent's collection
+MODELS = [Admin, Answer, MultipleChoiceAnswer, AppFeedback, Badge, Checkpoint, Question, MultipleChoiceQuestion,
+          ObjectCheckpoint, PictureCheckpoint, Code, Derivative, Favourites, MuseumObject, PersistedQuery, Picture,
+          ProfilePicture, Tour, TourFeedback, User]
+
+# query shapes used by the resolvers and mutations in app. the values are placeholders, only the shape matters
+# for the query planner. add new shapes here when adding queries so verify can check them at deploy
+QUERY_SHAPES = [
+    ('answers to a question', Answer, {'question': ObjectId()}),
+    ('answers of a user', Answer, {'user': ObjectId()}),
+    ('answer of a user to a question', Answer, {'question': ObjectId(), 'user': ObjectId()}),
+    ('checkpoints of a tour', Checkpoint, {'tour': ObjectId()}),
+    ('checkpoints before a checkpoint of a tour', Checkpoint, {'tour': ObjectId(), 'rank__lt': 1.0}),
+    ('questions of a tour', Question, {'tour': ObjectId()}),
+    ('questions linking an object', Question, {'linked_objects__contains': ObjectId()}),
+    ('checkpoints of an object', ObjectCheckpoint, {'museum_object': ObjectId()}),
+    ('version of a picture', Derivative, {'source': ObjectId(), 'width': 320, 'format': 'webp'}),
+    ('text search of objects', MuseumObject, {'__raw__': {'$text': {'$search': 'schale', '$language': 'german'}}}),
+    ('tours by status', Tour, {'status': 'featured'}),
+    ('tours of an owner', Tour, {'owner': ObjectId()}),
+    ('tours a user joined', Tour, {'users__contains': ObjectId()}),
+    ('membership of a user in a tour', Tour, {'id': ObjectId(), 'users': ObjectId()}),
+    ('tour by search id', Tour, {'search_id': ''}),
+    ('feedback of a tour', TourFeedback, {'tour': ObjectId()}),
+    ('unread app feedback', AppFeedback, {'read': False}),
+    ('favourites containing an object', Favourites, {'favourite_objects__contains': ObjectId()}),
+    ('user by username', User, {'username': ''}),
+    ('admin by username', Admin, {'username': ''}),
+]
+
+
+def _stages(plan):
+    """ yields the stages of a query plan and all of its input stages """
+    yield plan.get('stage')
+    if 'inputStage' in plan:
+        yield from _stages(plan['inputStage'])
+    for stage in plan.get('inputStages', []):
+        yield from _stages(stage)
+
+
+def _uncovered_shapes():
+    """ returns the names of all query shapes whose winning plan scans the whole collection """
+    uncovered = []
+    for name, model, filters in QUERY_SHAPES:
+        plan = model.objects(**filters).explain()['queryPlanner']['winningPlan']
+        if 'COLLSCAN' in _stages(plan):
+            uncovered.append(name)
+    return uncovered
+
+
+@index_cli.command('create')
+def create_indexes():
+    """ Creates all indexes declared in the models. Existing indexes are left untouched. """
+    for model in MODELS:
+        model.ensure_indexes()
+        click.echo('ensured indexes of {}'.format(model.__name__))
+
+
+@index_cli.command('verify')
+@click.pass_context
+def verify_indexes(ctx):
+    """ Reports missing indexes and query shapes that are not served by an index. Exits with 1 if there are any. """
+    ok = True
+    for model in MODELS:
+        # indexes of subclasses are compared with their parent as they share its collection
+        if model._meta.get('abstract') or model._class_name != model._class_name.split('.')[0]:
+            continue
+        # the _id index only shows up once the collection holds a document and always exists afterwards
+        missing = [index for index in model.compare_indexes()['missing'] if index != [('_id', 1)]]
+        for index in missing:
+            ok = False
+            click.echo('missing index on {}: {}'.format(model._get_collection_name(), index))
+    for name in _uncovered_shapes():
+        ok = False
+        click.echo('collection scan for query: {}'.format(name))
+    if not ok:
+        ctx.exit(1)
+    click.echo('all indexes present and all known query shapes use an index')
+
+
+@checkpoint_cli.command('rebalance')
+def rebalance_checkpoints():
+    """
+        Spreads the ranks of the checkpoints in every tour evenly. Also creates the ranks of checkpoints stored before
+        ranks existed from their index and the last rank of tours that were created before tours tracked it, so it has
+        to run once when deploying either. Safe to run while the server is running.
+    """
+    tours = Checkpoint._get_collection().distinct('tour')
+    for tour in tours:
+        rebalance(tour)
+    click.echo('rebalanced the checkpoints of {} tours'.format(len(tours)))
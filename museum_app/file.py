@@ -1,20 +1,109 @@
-import io
-from flask import Blueprint, send_file, request, jsonify
+import os
+from datetime import datetime, timezone
+from flask import Blueprint, Response, request, jsonify, stream_with_context, send_file
+from werkzeug.wsgi import FileWrapper
 from app.WebMutations import admin_claim
+from app.Loaders import get_or_none, get_reference
+from app.Export import FORMATS, question_rows, user_rows, render
+from app.Badges import invalidate_catalogue
+from app.Images import MIMETYPES, choose_width, negotiate, version
+from app import BlobCache
 from models.Answer import Answer
-from models.Checkpoint import Checkpoint
+from models.Question import Question
 from models.MultipleChoiceQuestion import MultipleChoiceQuestion
 from models.Picture import Picture
 from models.ProfilePicture import ProfilePicture
 from models.Badge import Badge
 from models.User import User
-from flask_jwt_extended import jwt_required, get_jwt_claims
+from models.Tour import Tour
+from flask_jwt_extended import jwt_required, get_jwt_claims, get_jwt_identity
 
 fileBP = Blueprint('app', __name__, url_prefix='/file')
 """
-    Flask Blueprint for alternative file up&download and pdf export of user answers to questions through REST calls. 
+    Flask Blueprint for alternative file up&download and text, csv and pdf export of user answers to questions through
+    REST calls. 
+    Pictures are streamed from GridFS chunk by chunk and may be cached by clients and proxies, which have to revalidate
+    them on every use as pictures are replaced under the same URL. Requests that send the ETag or date they cached are
+    answered with 304 if the picture did not change, byte ranges are supported.
+    Each node keeps the pictures it sent in a local disk cache and sends them from there, see app.BlobCache.
 """
 
+# model and stored format of the documents holding pictures by the type parameter of download
+PICTURE_TYPES = {'Picture': (Picture, 'jpeg'), 'ProfilePicture': (ProfilePicture, 'jpeg'), 'Badge': (Badge, 'png')}
+
+
+def _conditional(response, etag, last_modified, length):
+    response.content_length = length
+    response.last_modified = last_modified
+    response.set_etag(etag)
+    response.cache_control.public = True
+    # UpdatePicture and the like replace pictures under the same id, so the URL does not change with the picture.
+    # caches revalidate with the ETag, which changes with the content, and mostly get a 304 without the picture
+    response.cache_control.no_cache = True
+    # send_file would otherwise add its default max age
+    response.cache_control.max_age = 0
+    # answers If-None-Match and If-Modified-Since with 304 and Range with 206
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
+
+
+def _send_picture(grid_out, mimetype, etag):
+    """ returns a response streaming grid_out, a GridOut, from GridFS """
+    # storing it in the cache may have read it already
+    grid_out.seek(0)
+    response = Response(FileWrapper(grid_out, grid_out.chunk_size), mimetype=mimetype, direct_passthrough=True)
+    return _conditional(response, etag, grid_out.upload_date, grid_out.length)
+
+
+def _send_entry(entry):
+    """
+        returns a response sending the file of entry, an app.BlobCache entry. the server may use sendfile for it.
+        returns None if another process evicted the entry in the meantime
+    """
+    try:
+        length = os.path.getsize(entry.path)
+        response = send_file(entry.path, mimetype=entry.mimetype, add_etags=False)
+    except OSError:
+        return None
+    last_modified = datetime.fromtimestamp(entry.last_modified, timezone.utc) if entry.last_modified else None
+    return _conditional(response, entry.etag, last_modified, length)
+
+
+def _send_version(type, id, original):
+    """
+        returns a response sending the version of the picture of the document of type with id the request asks for
+        with w and format or by its Accept header, see app.Images. original is the format the picture is stored in.
+        the picture is sent from the local cache if it is there, the database is only asked once its entry is older
+        than BLOB_CACHE_TTL. returns None if there is no such document or picture or the format is unknown
+    """
+    requested = request.args.get('format')
+    format = negotiate(requested, request.headers.get('Accept'), original)
+    if format is None:
+        return None
+    width = request.args.get('w', type=int)
+    # the cache key uses the width that is actually sent so all requested widths rounded to it share one entry
+    key = (type, id, choose_width(width) if width is not None else 0, format)
+    entry = BlobCache.lookup(key)
+    response = _send_entry(entry) if entry is not None else None
+    if response is not None:
+        response.headers['X-Cache'] = 'HIT'
+    else:
+        model = PICTURE_TYPES[type][0]
+        document = get_or_none(model, id=id)
+        grid_out = version(document.picture, width, format, original).get() if document is not None else None
+        if grid_out is None:
+            return None
+        # GridFS stores the md5 of files uploaded with pymongo 3, files without one are identified by their id
+        etag = grid_out.md5 or str(grid_out._id)
+        entry = BlobCache.store(key, grid_out, MIMETYPES[format], etag)
+        response = _send_entry(entry) if entry is not None else None
+        if response is None:
+            response = _send_picture(grid_out, MIMETYPES[format], etag)
+        response.headers['X-Cache'] = 'MISS'
+    if requested is None:
+        # the format depends on the Accept header, caches have to keep one copy per value
+        response.vary.add('Accept')
+    return response
+
 
 @fileBP.route('/download', methods=['GET'])
 @jwt_required
@@ -24,42 +113,40 @@ def download():
     Parameters:
         type, String, the DocumentType of the object the picture is taken from. May be Picture, ProfilePicture or Badge
         id, String, the DocumentId of the document that contains the picture in the database
-     if successful returns the image as attachment as id.jpeg or id.png for badges
+        w, Int, optional, width in pixels the picture is scaled down to. rounded up to one of the configured widths
+        format, String, optional, jpeg, webp or png. without it webp is sent if the Accept header allows it
+     if successful returns the image as jpeg or png for badges, or in the requested width and format
+     returns 304 without the image if the request has the ETag or a date not older than the image in If-None-Match or
+        If-Modified-Since. returns part of the image if the request has a Range header
      returns "invalid type or ID" if the given type was not among the options or and object with the ID did not exist
+        or the format was unknown
      NOTE requires a jwt access token in a Authorization header with value: Bearer <token>
     """
     type = request.args.get('type')
     id = request.args.get('id')
-    # handling a Picture object
-    if type == 'Picture':
-        # asserting the id is valid
-        if Picture.objects(id=id):
-            # getting the picture from mongodb and reading the bytes
-            pic = Picture.objects.get(id=id)
-            raw = pic.picture.read()
-            # converting bytes to image and sending it
-            return send_file(io.BytesIO(raw),
-                             attachment_filename=str(id) + '.jpeg',
-                             mimetype='image/jpeg')
-    # handling for other types is the same as for Picture
-    elif type == 'ProfilePicture':
-        if ProfilePicture.objects(id=id):
-            pic = ProfilePicture.objects.get(id=id)
-            raw = pic.picture.read()
-            return send_file(io.BytesIO(raw),
-                             attachment_filename=str(id) + '.jpeg',
-                             mimetype='image/jpeg')
-
-    elif type == 'Badge':
-        if Badge.objects(id=id):
-            badge = Badge.objects.get(id=id)
-            raw = badge.picture.read()
-            return send_file(io.BytesIO(raw),
-                             attachment_filename=str(id) + '.png',
-                             mimetype='image/png')
+    response = None
+    if type in PICTURE_TYPES and id is not None:
+        response = _send_version(type, id, PICTURE_TYPES[type][1])
+    if response is not None:
+        return response
     return jsonify({"Error": "Invalid type or ID"})
 
 
+@fileBP.route('/cache', methods=['GET'])
+@jwt_required
+def cache_stats():
+    """
+    Returns statistics of the local picture cache of the node answering the request, see app.BlobCache
+     if successful returns hits, misses, revalidations and evictions of the answering worker process since it started
+        and the number of entries and bytes in the cache of the node
+     returns "Admin claim could not be verified" if the caller is no admin
+     NOTE requires a jwt access token in a Authorization header with value: Bearer <token>
+    """
+    if get_jwt_claims() != admin_claim:
+        return jsonify({"Error": "Admin claim could not be verified"})
+    return jsonify(BlobCache.stats())
+
+
 @fileBP.route('/upload', methods=['POST'])
 @jwt_required
 def upload():
@@ -96,7 +183,7 @@ def upload():
     # creates a new Badge in the database
     elif type == 'Badge':
         id = request.args.get('id')
-        if id is None or Badge.objects(id=id):
+        if id is None or get_or_none(Badge, id=id) is not None:
             return jsonify({"Error": "Badge ID exists"})
         description = request.args.get('description')
         name = request.args.get('name')
@@ -105,63 +192,90 @@ def upload():
         f = request.files['file']
         badge.picture.put(f, content_type='image/png')
         badge.save()
-        for user in User.objects.all():
-            badges = user.badge_progress
-            badges[str(id)] = 0
-            user.update(set__badge_progress=badges)
-            user.save()
+        invalidate_catalogue()
         return str(id)
     else:
         return jsonify({"Error": "Invalid type"})
 
 
-# TODO: make this produce pdf
 @fileBP.route('/questionpdf', methods=['GET'])
 @jwt_required
 def generatepdf():
+    """
+    Exports answers either to a single question or of a single user
+    Parameters:
+        type, String, either question or user
+        id, String, the id of the question if type is question
+        username, String, the username of the user if type is user
+        format, String, text, csv or pdf. defaults to text
+     if successful returns the report as attachment named report with the extension of the format
+     NOTE requires a jwt access token in a Authorization header with value: Bearer <token>
+    """
     type = request.args.get('type')
+    format = request.args.get('format', default='text')
+    if format not in FORMATS:
+        return jsonify({"Error": "Invalid format"})
     if type == 'question':
         id = request.args.get('id')
-        if not Checkpoint.objects(id=id):
+        question = get_or_none(Question, id=id)
+        if question is None:
             return jsonify({"Error": "Invalid question ID"})
-        question = Checkpoint.objects.get(id=id)
         if not Answer.objects(question=question):
             return jsonify({"Error": "No answers for this question"})
-        answers = Answer.objects(question=question)
-        file = io.BytesIO()
-        file.write(str.encode("Exported answers for question: {} \n".format(question.id)))
-        file.write(str.encode("Question:{} \n".format(question.question)))
+        title = ["Exported answers for question: {}".format(question.id),
+                 "Question: {}".format(question.question)]
         if isinstance(question, MultipleChoiceQuestion):
-            file.write(str.encode("Possible answers: {} \n".format(question.possible_answers)))
-            file.write(str.encode("Indices of the correct answers : {} \n".format(question.correct_answers)))
-            file.write(str.encode("Maximum number of answers: {} \n".format(question.max_choices)))
-
-        for answer in answers:
-            file.write(str.encode("User: {} \n".format(answer.user.username)))
-            file.write(str.encode("Answer: {} \n".format(answer.answer)))
-
-        file.seek(0)
-        return send_file(file, attachment_filename='report.txt', mimetype='text/plain')
+            title.append("Possible answers: {}".format(', '.join(question.possible_answers)))
+            title.append("Correct answers: {}".format(
+                ', '.join(question.possible_answers[index] for index in question.correct_answers)))
+            title.append("Maximum number of answers: {}".format(question.max_choices))
+        return _export(title, ('User', 'Answer'), question_rows(question), format)
 
     elif type == 'user':
         username = request.args.get('username')
-        if not User.objects(username=username):
+        user = get_or_none(User, username=username)
+        if user is None:
             return jsonify({"Error": "User does not exist"})
-        user = User.objects.get(username=username)
         if not Answer.objects(user=user):
             return jsonify({"Error": "User has not submitted any answers"})
-        file = io.BytesIO()
-        file.write(str.encode("Exported answers for user: {} \n".format(user.username)))
-        answers = Answer.objects(user=user)
-        for answer in answers:
-            question = answer.question
-            file.write(str.encode("Question:{} \n".format(question.question)))
-            if isinstance(question, MultipleChoiceQuestion):
-                file.write(str.encode("Possible answers: {} \n".format(question.possible_answers)))
-                file.write(str.encode("Indices of the correct answers : {} \n".format(question.correct_answers)))
-                file.write(str.encode("Maximum number of answers: {} \n".format(question.max_choices)))
-            file.write(str.encode("Answer: {} \n".format(answer.answer)))
-        file.seek(0)
-        return send_file(file, attachment_filename='report.txt', mimetype='text/plain')
+        title = ["Exported answers for user: {}".format(user.username)]
+        return _export(title, ('Question', 'Answer'), user_rows(user), format)
     else:
         return jsonify({"Error": "Invalid type"})
+
+
+@fileBP.route('/export', methods=['GET'])
+@jwt_required
+def export():
+    """
+    Exports the answers of a user to the questions of a tour. Same report as the exportAnswers query of the app API
+    Parameters:
+        tour_id, String, document id of the tour
+        username, String, username of the user whose answers are exported
+        format, String, text, csv or pdf. defaults to text
+     if successful returns the report as attachment named report with the extension of the format
+     can only be called by the owner of the tour or an admin
+     NOTE requires a jwt access token in a Authorization header with value: Bearer <token>
+    """
+    format = request.args.get('format', default='text')
+    if format not in FORMATS:
+        return jsonify({"Error": "Invalid format"})
+    user = get_or_none(User, username=request.args.get('username'))
+    if user is None:
+        return jsonify({"Error": "User does not exist"})
+    tour = get_or_none(Tour, id=request.args.get('tour_id'))
+    if tour is None:
+        return jsonify({"Error": "Invalid tour ID"})
+    owner = get_reference(tour, 'owner')
+    if get_jwt_claims() != admin_claim and owner.username != get_jwt_identity():
+        return jsonify({"Error": "Only the owner of the tour can export answers"})
+    title = ['Antworten für den Nutzer {} im Rundgang {}.'.format(user.username, tour.name)]
+    return _export(title, ('Frage', 'Antwort'), user_rows(user, tour), format)
+
+
+def _export(title, columns, rows, format):
+    # streamed without a content length so the report is sent while the answers are read from the database
+    mimetype, extension = FORMATS[format]
+    response = Response(stream_with_context(render(title, columns, rows, format)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = 'attachment; filename=report.{}'.format(extension)
+    return response
@@ -0,0 +1,140 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import partial
+from flask import current_app, request
+from graphene_file_upload.flask import FileUploadGraphQLView
+from graphql import GraphQLError, parse, validate
+from graphql.backend.base import GraphQLDocument
+from graphql.backend.core import GraphQLCoreBackend
+from graphql.execution import execute, ExecutionResult
+from graphql_server import HttpQueryError, load_json_body
+from models.PersistedQuery import PersistedQuery
+"""
+    Automatic persisted queries for the GraphQL endpoints, as implemented by Apollo clients.
+    A client sends the SHA-256 of its query in extensions.persistedQuery.sha256Hash, without the query. If the server
+    does not know the hash it answers with the error PersistedQueryNotFound and the client sends the query along with
+    the hash once, which registers it. Afterwards the hash alone is enough, also in GET requests, whose URL is then
+    short and can be cached by HTTP caches. Registered queries are stored in the database so every node knows them.
+    Only queries that parse and validate against the schema are registered, at most PERSISTED_QUERY_LIMIT of them.
+    Registrations not used for a while expire, see models.PersistedQuery, and clients simply register them again.
+    Parsed and validated queries are kept in a bounded cache, so parsing and validation only happen on a cache miss.
+    This applies to all requests, with or without persisted queries.
+"""
+
+# used when the app is not configured
+DEFAULT_CACHE_SIZE = 500
+DEFAULT_LIMIT = 10000
+
+
+def _invalid(errors, *args, **kwargs):
+    return ExecutionResult(errors=errors, invalid=True)
+
+
+class CachedBackend(GraphQLCoreBackend):
+    """
+        GraphQL backend keeping the size most recently used documents parsed and validated, keyed by the SHA-256 of
+        the query. Invalid queries are not kept, so they can not push valid ones out. One backend serves a single
+        schema
+    """
+
+    def __init__(self, size=DEFAULT_CACHE_SIZE, executor=None):
+        super().__init__(executor)
+        self.size = size
+        self.documents = OrderedDict()
+        self.lock = threading.Lock()
+
+    def query(self, sha256):
+        """ returns the query with the SHA-256 as hex string if its document is cached, None otherwise """
+        with self.lock:
+            document = self.documents.get(sha256)
+        return document.document_string if document is not None else None
+
+    def document_from_string(self, schema, document_string):
+        document, _ = self.load(schema, document_string)
+        return document
+
+    def load(self, schema, document_string):
+        """ returns the document of the query and whether it is valid. raises GraphQLSyntaxError for syntax errors """
+        key = hashlib.sha256(document_string.encode('utf-8')).hexdigest()
+        with self.lock:
+            document = self.documents.get(key)
+            if document is not None:
+                self.documents.move_to_end(key)
+                return document, True
+        document_ast = parse(document_string)
+        errors = validate(schema, document_ast)
+        if errors:
+            return GraphQLDocument(schema=schema, document_string=document_string, document_ast=document_ast,
+                                   execute=partial(_invalid, errors)), False
+        document = GraphQLDocument(schema=schema, document_string=document_string, document_ast=document_ast,
+                                   execute=partial(execute, schema, document_ast, **self.execute_params))
+        with self.lock:
+            self.documents[key] = document
+            while len(self.documents) > self.size:
+                self.documents.popitem(last=False)
+        return document, True
+
+
+class PersistedQueryGraphQLView(FileUploadGraphQLView):
+    """
+        GraphQL view accepting automatic persisted queries by POST and GET. Needs a CachedBackend as backend.
+        Successful GET responses carry an ETag so clients can revalidate them. They are private as the results depend on
+        the token in the variables
+    """
+
+    def parse_body(self):
+        data = super().parse_body()
+        # batches are not enabled. form data is immutable
+        if isinstance(data, list):
+            return data
+        data = dict(data.items()) if not isinstance(data, dict) else data
+        extensions = data.get('extensions') or request.args.get('extensions')
+        if isinstance(extensions, str):
+            extensions = load_json_body(extensions)
+        persisted = (extensions or {}).get('persistedQuery')
+        if not isinstance(persisted, dict):
+            return data
+        sha256 = persisted.get('sha256Hash')
+        if persisted.get('version') != 1 or not isinstance(sha256, str):
+            raise HttpQueryError(400, 'Unsupported persisted query version')
+        query = data.get('query') or request.args.get('query')
+        if query:
+            if hashlib.sha256(query.encode('utf-8')).hexdigest() != sha256:
+                raise HttpQueryError(400, 'provided sha does not match query')
+            if self.backend.query(sha256) is None:
+                self.register(sha256, query)
+        else:
+            query = self.backend.query(sha256)
+            if query is None:
+                # refreshes the registration so it does not expire while clients use it
+                registered = PersistedQuery.objects(id=sha256).only('query').modify(set__used=datetime.utcnow())
+                if registered is None:
+                    # clients answer by sending the query along with the hash
+                    raise HttpQueryError(200, 'PersistedQueryNotFound')
+                query = registered.query
+        data['query'] = query
+        return data
+
+    def register(self, sha256, query):
+        """
+            stores the query under its SHA-256 if it is valid and there is room. otherwise the query is only executed,
+            with the errors of the query if it is invalid, and clients send it along again next time
+        """
+        try:
+            _, valid = self.backend.load(self.schema, query)
+        except GraphQLError:
+            return
+        limit = current_app.config.get('PERSISTED_QUERY_LIMIT', DEFAULT_LIMIT)
+        if valid and PersistedQuery.objects.count() < limit:
+            PersistedQuery(id=sha256, query=query).save()
+
+    def dispatch_request(self):
+        response = super().dispatch_request()
+        if request.method == 'GET' and response.status_code == 200:
+            response.add_etag()
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response = response.make_conditional(request)
+        return response
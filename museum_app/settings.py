@@ -13,3 +13,17 @@ ACCESS_EXP_LENGTH = 20
 SECRET_KEY = "2HyFpwHAwFkUUn"
 """Name of the file that contains the app factory function"""
 FLASK_APP = "__init__.py"
+"""Widths in pixels of the scaled versions of pictures. Requested widths are rounded up to the next of these."""
+IMAGE_WIDTHS = [160, 320, 640, 1280]
+"""Quality of scaled and converted pictures from 1 to 95."""
+IMAGE_QUALITY = 80
+"""Directory of the local picture cache, see app.BlobCache. Defaults to blobs in the instance folder."""
+BLOB_CACHE_DIR = None
+"""Size of the local picture cache in bytes. 0 disables it."""
+BLOB_CACHE_SIZE = 512 * 1024 * 1024
+"""Seconds a cached picture is sent without checking the database for changes made through other nodes."""
+BLOB_CACHE_TTL = 300
+"""Number of parsed and validated GraphQL queries kept per endpoint, see museum_app.persisted."""
+GRAPHQL_DOCUMENT_CACHE_SIZE = 500
+"""Maximum number of queries registered for automatic persisted queries, see museum_app.persisted."""
+PERSISTED_QUERY_LIMIT = 10000
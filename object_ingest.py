@@ -1,15 +1,30 @@
-import os
+import argparse
+import csv
+import sys
 import mongoengine
-from models.MuseumObject import MuseumObject
 import pandas as pd
+from pymongo import ReplaceOne
+from models.MuseumObject import MuseumObject
 from flask_mongoengine import MongoEngine
 from mongoengine import register_connection
 from models.Picture import Picture
+from ingest_sync import Report, picture_files, row_sha256, sync_pictures
 """
-Ingestion script for museum objects. Allows adding objects to the database in bulk. Does not make any updates to
-existing objects. If a objectId in the supplied data already exists in the database this will fail. Expects object data 
-to be located in data/objects.xlsx and pictures to be located at data/pictures. Paths are relative to the location of 
-this script. Script is run from the command line. Mongod service has to be running.  
+Ingestion script for museum objects. Allows adding objects to the database in bulk. Expects object data to be located
+in data/objects.xlsx and pictures to be located at data/pictures. Paths are relative to the location of this script.
+Script is run from the command line. Mongod service has to be running.
+Other object data can be given with --data, as xlsx or as csv or tsv with the same columns. The data is read row by
+row and processed BATCH_SIZE rows at a time, so memory use does not depend on the size of the inventory.
+By default every row is inserted as a new object and existing objects are not updated. If a objectId in the supplied
+data already exists in the database this will fail. Run with --sync to update the database to the current data
+instead: new rows are inserted, changed rows replace their existing object, unchanged rows and pictures are skipped
+and objects and pictures no longer in the data are reported. see ingest_sync
+Every batch is cleaned column by column with pandas string operations before any database work, see COLUMNS. Rows
+missing a required field or naming a picture that is not in data/pictures are reported and skipped. Run with
+--dry-run to only get that report without writing anything.
+Pictures are uploaded to GridFS by several threads and their documents inserted with a single insert_many.
+Objects are built completely from their row and written BATCH_SIZE at a time, so the number of round trips to the
+database does not grow with the number of fields.
 """
 
 
@@ -19,133 +34,194 @@ mongoengine.connect(host='localhost:27017')
 register_connection("object", "object")
 register_connection("file", "file")
 
-
-def object_ingest(picture_dict):
+# number of rows read and objects written at once
+BATCH_SIZE = 500
+# delimiters of the text formats by file extension
+DELIMITERS = {'.csv': ',', '.tsv': '\t'}
+# fields of MuseumObject, the column holding them, characters replaced by spaces in them and whether the field is
+# required. \xa0 is a non-line-breaking space some cells contain
+COLUMNS = [('category', 'Abteilung', '', True),
+           ('sub_category', 'Sammlungsbereich', '', True),
+           ('title', 'Titel', '', True),
+           ('description', 'Objektbeschreibung', '\n', False),
+           ('additional_information', 'additional', '\n', False),
+           ('interdisciplinary_context', 'Interdisciplinary', '', False),
+           ('year', 'Datierung', u'\xa0', False),
+           ('art_type', 'Objektgattung', '', False),
+           ('creator', 'Hersteller', u'\xa0', False),
+           ('material', 'Material', '', False),
+           ('size_', 'Size', '', False),
+           ('location', 'Verortung', '', False)]
+# column holding the object id. ids are taken as they are, tours and favourites of existing objects reference them
+ID_COLUMN = 'Inventarnummer'
+# column holding the file names of the pictures of an object, separated by commas
+PICTURE_COLUMN = 'Bild'
+
+
+def normalise(column, replace=''):
+    """ returns a column of cells as strings without surrounding whitespace. empty cells become empty strings """
+    # convert to string because numbers in cells are read as int or float
+    values = column.fillna('').astype(str)
+    for character in replace:
+        values = values.str.replace(character, ' ', regex=False)
+    values = values.str.strip()
+    return values.mask(values == 'nan', '')
+
+
+def _column(frame, name):
+    # a missing column counts as empty, so rows are reported as missing its field
+    if name in frame:
+        return frame[name]
+    return pd.Series(None, index=frame.index, dtype=object)
+
+
+def clean(frame, picture_dict):
+    """
+    returns the records of the objects in frame, a batch of rows from read_batches, and the problems of its rows.
+    records is a DataFrame with one column per field of MuseumObject and the same index as frame. problems is a
+    dictionary from row number to a list of descriptions. see object_ingest for picture_dict
+    """
+    records = pd.DataFrame({field: normalise(_column(frame, column), replace)
+                            for field, column, replace, _ in COLUMNS}, index=frame.index)
+    records.insert(0, 'object_id', _column(frame, ID_COLUMN).fillna('').astype(str))
+    problems = {}
+    for row in records.index[records['object_id'].str.strip() == '']:
+        problems.setdefault(row, []).append('missing {}'.format(ID_COLUMN))
+    for field, column, _, required in COLUMNS:
+        if required:
+            for row in records.index[records[field] == '']:
+                problems.setdefault(row, []).append('missing {}'.format(column))
+    # one picture name per entry, indexed by the row it is in
+    names = normalise(_column(frame, PICTURE_COLUMN), '\n').str.split(',').explode().str.strip()
+    names = names[names != '']
+    for row, name in names[~names.isin(list(picture_dict))].items():
+        problems.setdefault(row, []).append('unknown picture {}'.format(name))
+    # museumObject.picture is a list of references to Picture documents. the ids are enough to store them
+    ids = names.map(picture_dict).groupby(level=0).agg(list)
+    records['picture'] = [ids.get(row, []) for row in records.index]
+    return records, problems
+
+
+def _xlsx_rows(file_name):
+    # needs the dependency openpyxl. read only mode loads one row at a time instead of the whole sheet
+    from openpyxl import load_workbook
+    workbook = load_workbook(file_name, read_only=True, data_only=True)
+    try:
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _text_rows(file_name, delimiter):
+    with open(file_name, newline='', encoding='utf-8-sig') as file:
+        for row in csv.reader(file, delimiter=delimiter):
+            # empty cells are missing values, as in a spreadsheet
+            yield [cell if cell != '' else None for cell in row]
+
+
+def read_batches(file_name, size=BATCH_SIZE):
     """
-    Object ingestion function. Iterates through a pandas DataFrame created from the object data. Has to run after
-    picture_ingest as it needs its output.
+    yields the rows of the object data in file_name as DataFrames of up to size rows. columns are named by the first
+    row and the index is the number of the row in the file, counting from 1. cells keep the type they were read with.
+    file_name may be an xlsx file, of which the first sheet is read, or a csv or tsv file in utf-8. empty rows are
+    skipped
+    """
+    extension = file_name[file_name.rfind('.'):].lower()
+    rows = _text_rows(file_name, DELIMITERS[extension]) if extension in DELIMITERS else _xlsx_rows(file_name)
+    columns = next(rows, ())
+    batch, numbers = [], []
+    for number, row in enumerate(rows, 2):
+        if all(cell is None for cell in row):
+            continue
+        batch.append(row)
+        numbers.append(number)
+        if len(batch) == size:
+            yield pd.DataFrame(batch, index=numbers, columns=columns, dtype=object)
+            batch, numbers = [], []
+    if batch:
+        yield pd.DataFrame(batch, index=numbers, columns=columns, dtype=object)
+
+
+def _write(batch, sync):
+    if sync:
+        MuseumObject._get_collection().bulk_write(
+            [ReplaceOne({'_id': museum_object.object_id}, museum_object.to_mongo(), upsert=True)
+             for museum_object in batch], ordered=False)
+    else:
+        MuseumObject.objects.insert(batch, load_bulk=False)
+
+
+def object_ingest(picture_dict, file_name='data/objects.xlsx', sync=False, dry_run=False):
+    """
+    Object ingestion function. Reads the object data in batches, see read_batches, cleans them and writes the objects
+    of each batch at once. Has to run after picture_ingest as it needs its output.
     :param picture_dict:  output of picture_ingest, dictionary where keys are files names of pictures and values are the
                           document id of the Picture object in the database holding that file
+    :param file_name: path of the object data
+    :param sync: only write rows that are new or changed since the last ingestion. inserts all rows otherwise
+    :param dry_run: only report what would be written and which rows are invalid
+    :returns False if there were invalid rows
     """
-    # file path
-    file_name = 'data/objects.xlsx'
-    # reading data as a pandas dataframe. needs dependencies pandas and xlrd to read excel data
-    df = pd.read_excel(file_name, index_col=0)
-    # iterating through objects
-    for idx, row in df.iterrows():
-        # all required fields have to be passed here
-        museum_object = MuseumObject(object_id=str(row['Inventarnummer']), category=row['Abteilung'],
-                                     sub_category=row['Sammlungsbereich'], title=row['Titel'])
-        # need to save once before we can call update()
-        museum_object.save()
-        description = str(row['Objektbeschreibung'])
-        description = description.replace('\n', ' ')
-        if description == 'nan':
-            description = ''
-        museum_object.update(set__description=description)
-        additional_information = str(row['additional'])
-        if additional_information == 'nan':
-            additional_information = ''
-        additional_information = additional_information.replace('\n', ' ')
-        museum_object.update(set__additional_information=additional_information)
-
-        # mostly the same procedure for each field. explained once
-        # convert to string because pandas will read numbers in cells as int or float
-        inter = str(row['Interdisciplinary'])
-        # strip whitespaces left and right
-        inter = inter.strip()
-        if inter == 'nan':
-            inter = ''
-        museum_object.update(set__interdisciplinary_context=inter)
-
-        year = str(row['Datierung'])
-        # some fields had \xa0 characters in them. this is a non-line-breaking space so it's replaced by space
-        year = year.replace(u'\xa0', u' ')
-        year = year.strip()
-        if year == 'nan':
-            year = ''
-        museum_object.update(set__year=year)
-
-        art_type = str(row['Objektgattung'])
-        art_type = art_type.strip()
-        if art_type == 'nan':
-            art_type = ''
-        museum_object.update(set__art_type=art_type)
-
-        creator = str(row['Hersteller'])
-        creator = creator.replace(u'\xa0', u' ')
-        creator = creator.strip()
-        if creator == 'nan':
-            creator = ''
-        museum_object.update(set__creator=creator)
-
-        material = str(row['Material'])
-        material = material.strip()
-        if material == 'nan':
-            material = ''
-        museum_object.update(set__material=material)
-
-        size = str(row['Size'])
-        size = size.strip()
-        if size == 'nan':
-            size = ''
-        museum_object.update(set__size_=size)
-
-        location = str(row['Verortung'])
-        location = location.strip()
-        if location == 'nan':
-            location = ''
-        museum_object.update(set__location=location)
-
-        # museumObject.picture is a list of references to Picture documents.
-        # this creates the list by going from table entry -> file name -> document id -> object to add to list
-        pictures = []
-        # split the table entry to get all file names associated with the currrent object
-        for picture_name in [name.strip() for name in row['Bild'].replace('\n', '').split(',')]:
-            # get the document id from the input dictionary created by picture_ingest
-            pid = picture_dict[picture_name]
-            # get the actual database object and append the reference
-            pic = Picture.objects.get(id=pid)
-            pictures.append(pic)
-        museum_object.update(set__picture=pictures)
-        museum_object.save()
-
-
-def picture_ingest():
+    report = Report('objects')
+    # object id and row hash of all objects in the database
+    existing = dict(MuseumObject.objects.scalar('object_id', 'sha256')) if sync else {}
+    seen = set()
+    for frame in read_batches(file_name):
+        records, problems = clean(frame, picture_dict)
+        hashes = frame.apply(row_sha256, axis=1)
+        objects = []
+        for row, record in zip(records.index, records.to_dict('records')):
+            object_id = record['object_id']
+            if object_id in seen:
+                problems.setdefault(row, []).append('duplicate {}'.format(ID_COLUMN))
+            if row in problems:
+                report.invalid.append('row {} ({}): {}'.format(row, object_id, ', '.join(problems[row])))
+                continue
+            seen.add(object_id)
+            if object_id in existing and existing[object_id] == hashes[row]:
+                report.unchanged += 1
+                continue
+            if object_id in existing:
+                report.updated += 1
+            else:
+                report.inserted += 1
+            objects.append(MuseumObject(sha256=hashes[row], **record))
+        if objects and not dry_run:
+            # replaces changed objects and inserts new ones with sync
+            _write(objects, sync)
+    report.removed.extend(sorted(set(existing) - seen))
+    report.print()
+    return not report.invalid
+
+
+def picture_ingest(sync=False, dry_run=False):
     """ Ingestion for object pictures. Allows ingestion of pictures in bulk. Only creates picture objects and does not
         link them to MuseumObject entries. Pictures are assumed to be located in data/pictures relative to the location
-         of this script and saved in jpg format."""
-    picture_directory = 'data/pictures'
-    # defining output var
-    id_dict = {}
-    # iterating through all files in the directory
-    # using with to ensure closing
-    with os.scandir(picture_directory) as directory:
-        for file in directory:
-            # ignore sub directories
-            if file.is_file():
-                # ignore random png files that were in sample data.
-                # convert before running the script if any are in the wrong format
-                if file.path.endswith('jpg'):
-                    # opening actual file to get the data
-                    # again using with to ensure closing
-                    # mode HAS to be rb for mongoengine to be able to read the bytes
-                    with open(file.path, 'rb') as picture:
-                        # defining document to hold the file
-                        pic = Picture()
-                        # storing data in GridFS FileField
-                        pic.picture.put(picture, content_type='image/jpeg')
-                        pic.save()
-                        # reloading to access id
-                        pic.reload()
-                        # add to output
-                        id_dict[str(file.name)] = str(pic.id)
-
-    return id_dict
-
-
+         of this script and saved in jpg format. With sync only new and changed files are uploaded.
+         Returns a dictionary where keys are file names and values the document ids, which are None with dry_run"""
+    # ignore random png files that were in sample data.
+    # convert before running the script if any are in the wrong format
+    files = picture_files('data/pictures', 'jpg')
+    if dry_run:
+        return {name: None for name, _ in files}
+    report = Report('pictures')
+    picture_dict = sync_pictures(Picture, files, 'image/jpeg', report, sync)
+    report.print()
+    return picture_dict
+
+
+parser = argparse.ArgumentParser(description='Ingests the museum objects in data/objects.xlsx and their pictures.')
+parser.add_argument('--data', default='data/objects.xlsx', help='object data as xlsx, csv or tsv file')
+parser.add_argument('--sync', action='store_true',
+                    help='only write new and changed objects and pictures and report removed ones')
+parser.add_argument('--dry-run', action='store_true',
+                    help='only report invalid rows and what would be written, without writing anything')
+args = parser.parse_args()
 # first run picture ingest to get the dictionary
-picture_dict = picture_ingest()
+picture_dict = picture_ingest(args.sync, args.dry_run)
 # then give the dictionary to object ingest
-object_ingest(picture_dict)
-
+valid = object_ingest(picture_dict, args.data, args.sync, args.dry_run)
+if args.dry_run:
+    print('dry run, nothing was written')
+    if not valid:
+        sys.exit(1)
@@ -1,11 +1,14 @@
-import os
+import argparse
 import mongoengine
 from flask_mongoengine import MongoEngine
 from mongoengine import register_connection
 from models.ProfilePicture import ProfilePicture
+from ingest_sync import Report, picture_files, sync_pictures
 """
 Ingestion script for profile pictures. Allows adding profile pictures to the database in bulk. Pictures are assumed to 
 be in jpg format and located at data/profilepictures relative to the location of this script. 
+Run with --sync to only upload new and changed pictures and report removed ones instead of adding all of them again.
+see ingest_sync
 """
 
 # connect to database. assumes default port and no password
@@ -14,30 +17,14 @@ mongoengine.connect(host='localhost:27017')
 register_connection("file", "file")
 
 
-def ingest_profile_pictures():
-    # data path relative to this script
-    file_path = 'data/profilepictures'
-    # iterating through the directory
-    with os.scandir(file_path) as directory:
-        for file in directory:
-            # ignoring subdirectories
-            if file.is_file():
-                # ignoring non-jpg files. convert to jpg before running
-                if file.path.endswith('jpg'):
-                    # get the actual data
-                    # using with to ensure to file is closed
-                    # mode HAS to be rb for mongoengine to be able to read the file
-                    with open(file.path, 'rb') as picture:
-                        # defining document
-                        pic = ProfilePicture()
-                        # adding data to GridFS FileField
-                        pic.picture.put(picture, content_type='image/jpeg')
-                        # saving
-                        pic.save()
-                        # reloading to get id
-                        pic.reload()
-                        # printing id for feedback on if the script is working.
-                        print(pic.id)
+def ingest_profile_pictures(sync=False):
+    report = Report('profile pictures')
+    # data path relative to this script. ignoring non-jpg files, convert to jpg before running
+    sync_pictures(ProfilePicture, picture_files('data/profilepictures', 'jpg'), 'image/jpeg', report, sync)
+    # printing the numbers for feedback on if the script is working
+    report.print()
 
 
-ingest_profile_pictures()
+parser = argparse.ArgumentParser(description='Ingests the profile pictures in data/profilepictures.')
+parser.add_argument('--sync', action='store_true', help='only upload new and changed pictures and report removed ones')
+ingest_profile_pictures(parser.parse_args().sync)